@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Inputs of the benchmarks: cells of data/input_data and synthetic masks.
+"""
+import os
+
+import numpy as np
+import cv2
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'input_data')
+FILENAME_TEMPLATE = '20180606-SLP_Multiplexing_p1_C03_x00{x}_y000_z000_t000_{image_type}_Label{label}.png'
+IMAGE_TYPES = {
+    'pbodies': '13_Pbody_Segm',
+    'protein': '13_Succs',
+    'dapi': '2_DAPI',
+    'cellmask': 'segmentation',
+}
+
+# Bundled cells with few, a median number and many P-bodies, as
+# (site_x, label): number of P-bodies in the cytoplasm
+CELLS = {
+    'sparse': (1, 6),    # 3 P-bodies
+    'median': (2, 17),   # 12 P-bodies
+    'dense': (4, 26),    # 34 P-bodies
+}
+
+
+def load_cell(name):
+    '''
+    Returns a dict image type: image of one of the CELLS
+    '''
+    site_x, label = CELLS[name]
+    images = {}
+    for image_type, image_name in IMAGE_TYPES.items():
+        path = os.path.join(DATA_PATH, FILENAME_TEMPLATE.format(x = site_x, image_type = image_name, label = label))
+        images[image_type] = cv2.imread(path, 0)
+        if images[image_type] is None:
+            raise IOError('Could not read image ' + path)
+    return images
+
+
+def synthetic_cytoplasm(shape = (640, 640), cell_radius = 200, nucleus_radius = 80):
+    '''
+    Returns a mask of a round cell with a round nucleus cut out (255 in the
+    cytoplasm, 0 elsewhere), about the size of the cells of the screen
+    '''
+    mask = np.zeros(shape, dtype=np.uint8)
+    center = (shape[1] // 2, shape[0] // 2)
+    cv2.circle(mask, center, cell_radius, 255, -1)
+    cv2.circle(mask, center, nucleus_radius, 0, -1)
+    return mask
+
+
+def uniform_points(mask, n, seed = 0):
+    '''
+    Returns an (n, 2) array of x, y coordinates drawn uniformly from the
+    non-zero pixels of mask
+    '''
+    rng = np.random.default_rng(seed)
+    y, x = np.nonzero(mask)
+    chosen = rng.choice(len(x), size = n, replace = False)
+    return np.stack([x[chosen], y[chosen]], axis=1).astype(np.float64)
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of the per-cell preprocessing (P-bodies, masks, smoothing and
+protein intensities) and of a whole analysis, on bundled cells.
+"""
+import numpy as np
+
+from p_body_randomness.cell_masks import crop_to_cell
+from p_body_randomness.centroids import extract_centroids
+from p_body_randomness.extract_sample_areas import extract_sample_area
+from p_body_randomness.sampling import SamplingTable
+from p_body_randomness.smooth_image import smooth_protein_image
+from p_body_randomness.protein_signal_calculation import calculate_mean_intensities
+from p_body_randomness.analyses import ANALYSES
+
+from .common import CELLS, load_cell
+
+
+class CellPreprocessing:
+    params = (list(CELLS), [False, True])
+    param_names = ['cell', 'cropped']
+
+    def setup(self, cell, cropped):
+        self.images = load_cell(cell)
+        if cropped:
+            self.images, _ = crop_to_cell(self.images)
+        self.cytoplasm = extract_sample_area(self.images['cellmask'], self.images['dapi'])
+
+    def time_extract_centroids(self, cell, cropped):
+        extract_centroids(self.images['pbodies'])
+
+    def time_extract_sample_area(self, cell, cropped):
+        extract_sample_area(self.images['cellmask'], self.images['dapi'])
+
+    def time_sampling_table(self, cell, cropped):
+        SamplingTable(self.cytoplasm)
+
+    def time_smooth_protein_image(self, cell, cropped):
+        smooth_protein_image(self.images['protein'], self.images['pbodies'], self.images['cellmask'], self.images['dapi'])
+
+    def peakmem_smooth_protein_image(self, cell, cropped):
+        smooth_protein_image(self.images['protein'], self.images['pbodies'], self.images['cellmask'], self.images['dapi'])
+
+    def time_calculate_mean_intensities(self, cell, cropped):
+        calculate_mean_intensities(self.images['protein'], self.images['pbodies'], self.images['cellmask'], self.images['dapi'])
+
+    def peakmem_calculate_mean_intensities(self, cell, cropped):
+        calculate_mean_intensities(self.images['protein'], self.images['pbodies'], self.images['cellmask'], self.images['dapi'])
+
+
+class Analyses:
+    # A whole analysis of a cell as run by the pipeline (cropped images, 1000
+    # simulation rounds for the nearest neighbor analyses)
+    params = (list(CELLS), ['nn_uniform_sampling', 'nn_area_sampling', 'protein_intensities'])
+    param_names = ['cell', 'analysis']
+    timeout = 120
+
+    def setup(self, cell, analysis):
+        self.images, _ = crop_to_cell(load_cell(cell))
+        self.parameters = dict(ANALYSES[analysis].parameters)
+
+    def time_analysis(self, cell, analysis):
+        ANALYSES[analysis].function(self.images, self.parameters, np.random.SeedSequence(0))
+
+    def peakmem_analysis(self, cell, analysis):
+        ANALYSES[analysis].function(self.images, self.parameters, np.random.SeedSequence(0))
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of the simulation path: sampling P-bodies and nearest neighbor
+distances, on a synthetic cytoplasm with an increasing number of P-bodies.
+"""
+import numpy as np
+
+from p_body_randomness.sampling import SamplingTable, sample_pbodies
+from p_body_randomness.simulation import simulate_null_distribution
+from p_body_randomness.metrics import nearest_neighbor_distance, mean_nearest_neighbor_distances
+
+from .common import synthetic_cytoplasm, uniform_points
+
+
+class Sampling:
+    params = [3, 12, 34, 100, 300]
+    param_names = ['n']
+
+    def setup(self, n):
+        self.sampling_table = SamplingTable(synthetic_cytoplasm())
+
+    def time_sample_pbodies(self, n):
+        sample_pbodies(self.sampling_table, n, rng = np.random.default_rng(0))
+
+    def time_simulate_null_distribution(self, n):
+        # 100 of the 1000 rounds of a cell
+        simulate_null_distribution(self.sampling_table, n, 100, seed = 0)
+
+    def peakmem_simulate_null_distribution(self, n):
+        simulate_null_distribution(self.sampling_table, n, 100, seed = 0)
+
+
+class NearestNeighbors:
+    params = [3, 12, 34, 100, 300]
+    param_names = ['n']
+
+    def setup(self, n):
+        mask = synthetic_cytoplasm()
+        self.points = uniform_points(mask, n)
+        self.rounds = np.stack([uniform_points(mask, n, seed) for seed in range(100)])
+
+    def time_nearest_neighbor_distance(self, n):
+        nearest_neighbor_distance(self.points)
+
+    def time_mean_nearest_neighbor_distances(self, n):
+        mean_nearest_neighbor_distances(self.rounds)
+
+    def peakmem_mean_nearest_neighbor_distances(self, n):
+        mean_nearest_neighbor_distances(self.rounds)
@@ -0,0 +1,437 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+The analyses the pipeline can run on a single cell.
+
+Every analysis is a function analysis(images, parameters, seed, cache) that
+gets the images of one cell (a dict of image_type: numpy array), its
+parameters, the seed of the random stream of the cell (a numpy SeedSequence)
+and optionally the CellCache of the cell. It returns a list of result rows
+(one value per column of the analysis) or raises a TooFewPbodiesException to
+skip the cell.
+
+Analyses draw all random numbers from numpy.random.default_rng(seed), never
+from the global random state, so the results of a cell only depend on its
+seed and not on which other analyses run.
+"""
+from collections import namedtuple
+
+import numpy as np
+from scipy.stats import norm
+
+from p_body_randomness.cell_masks import CellMasks
+from p_body_randomness.extract_sample_areas import extract_sample_area
+from p_body_randomness.sampling import sample_pbodies, SamplingTable
+from p_body_randomness.simulation import simulate_null_distribution, simulate_until_significant
+from p_body_randomness.centroids import extract_pbodies, classify_pbodies
+from p_body_randomness.metrics import nearest_neighbor_distance, clark_evans_mean_nn_distance, mask_perimeter
+from p_body_randomness.smooth_image import smooth_protein_image, add_nuclear_probability
+from p_body_randomness.protein_signal_calculation import ProteinContext
+from p_body_randomness.spatial_statistics import envelope_tests
+from p_body_randomness.cluster import TooFewPbodiesException
+
+# The parameters of an analysis are the defaults of all parameters it uses,
+# only these are passed to it and swept for it
+Analysis = namedtuple('Analysis', ['function', 'image_types', 'columns', 'output_prefix', 'parameters'])
+
+# Parameters of the nearest neighbor analyses that decide how many simulation
+# rounds are run (see simulation.simulate_until_significant)
+adaptive_simulation_parameters = {
+    'adaptive_simulation': False,
+    'p_value_thresholds': [0.05, 0.95],
+    'p_value_confidence': 0.99,
+    'max_simulation_rounds': 10000,
+}
+
+# The mean protein intensities are always measured outside the nucleus mask of
+# this DAPI threshold, like the original calculate_mean_intensities, so that
+# they do not change with the dapi_threshold of an analysis (e.g. in a sweep)
+INTENSITY_DAPI_THRESHOLD = 10
+
+# Defaults of the parameters shared by several analyses
+default_parameters = {
+    'pbody_area_threshold': 5,
+    'dapi_threshold': 10,
+    'min_nb_pbodies': 3,
+}
+
+
+def _shared_parameters(*names):
+    # The defaults of the shared parameters an analysis uses
+    return {name: default_parameters[name] for name in names}
+
+
+class CellCache:
+    '''
+    Intermediate results of one cell (masks, P-bodies, sampling tables, ...)
+    shared by all analyses and parameter combinations evaluated on the cell.
+    Every value is computed the first time it is requested and stored under a
+    key made of the parameters it depends on.
+    '''
+
+    def __init__(self, images):
+        self.images = images
+        self._values = {}
+
+    def get(self, key, compute):
+        if key not in self._values:
+            self._values[key] = compute()
+        return self._values[key]
+
+    def masks(self, dapi_threshold):
+        return self.get(('masks', dapi_threshold), lambda: CellMasks(self.images['cellmask'], self.images['dapi'], dapi_threshold))
+
+    def pbodies(self, area_threshold):
+        return self.get(('pbodies', area_threshold), lambda: extract_pbodies(self.images['pbodies'], area_threshold))
+
+    def protein_context(self):
+        '''ProteinContext of the real P-bodies (see INTENSITY_DAPI_THRESHOLD)'''
+        images = self.images
+        return self.get(('protein_context',), lambda: ProteinContext(images['protein'], images['pbodies'], images['cellmask'], images['dapi'], masks = self.masks(INTENSITY_DAPI_THRESHOLD)))
+
+    def mean_intensities(self):
+        '''Mean protein intensity in the cytoplasm and around the real P-bodies'''
+        context = self.protein_context()
+        return self.get(('mean_intensities',), lambda: [context.cytoplasm_mean, context.surround_mean(self.images['pbodies'])])
+
+    def cytoplasm_sampling_table(self, dapi_threshold):
+        '''SamplingTable of the cytoplasm (uniform sampling)'''
+        def compute():
+            masks = self.masks(dapi_threshold)
+            return SamplingTable(extract_sample_area(self.images['cellmask'], self.images['dapi'], dapi_threshold, masks = masks))
+        return self.get(('cytoplasm_sampling_table', dapi_threshold), compute)
+
+    def uniform_simulation(self, parameters, number_of_pbodies, rounds, seed):
+        '''
+        Simulation rounds of number_of_pbodies P-bodies sampled uniformly in
+        the cytoplasm (see simulate_null_distribution). Analyses that ask for
+        the same simulation get the same rounds, which are only simulated once.
+        '''
+        sampling_table = self.cytoplasm_sampling_table(parameters['dapi_threshold'])
+        return self.get(('uniform_simulation', parameters['dapi_threshold'], number_of_pbodies, rounds, parameters['min_sampling_distance']),
+                        lambda: simulate_null_distribution(sampling_table, number_of_pbodies, rounds, min_distance = parameters['min_sampling_distance'], seed = seed))
+
+    def volume_sampling_table(self, parameters):
+        '''SamplingTable of the smoothed protein signal'''
+        def compute():
+            masks = self.masks(parameters['dapi_threshold'])
+            cytoplasmic_mask = extract_sample_area(self.images['cellmask'], self.images['dapi'], parameters['dapi_threshold'], masks = masks)
+            smooth = smooth_protein_image(self.images['protein'], self.images['pbodies'], cytoplasmic_mask, self.images['dapi'], nucleus_percentage = parameters['percentage_pbodies_in_nucleus'], nucleus_threshold = parameters['dapi_threshold'], masks = masks)
+            return SamplingTable(smooth)
+        return self.get(('volume_sampling_table', parameters['dapi_threshold'], parameters['percentage_pbodies_in_nucleus']), compute)
+
+
+def _check_nb_pbodies(number_of_pbodies, parameters):
+    # Nearest neighbors can only be calculate if there are at least 3 P-bodies
+    if number_of_pbodies < parameters['min_nb_pbodies']:
+        raise TooFewPbodiesException("This cell only has " + str(number_of_pbodies) + " P-bodies.")
+
+
+def _reports_simulation_rounds(parameters):
+    # The number of simulation rounds only differs between the cells with
+    # adaptive_simulation or the clark_evans null model
+    return parameters.get('adaptive_simulation', False) or parameters.get('null_model') == 'clark_evans'
+
+
+def _simulation_rounds(rounds, parameters):
+    # The Number_of_simulation_rounds column of the nearest neighbor analyses
+    return [rounds] if _reports_simulation_rounds(parameters) else []
+
+
+def _simulate_mean_nn_distances(sampling_table, number_of_pbodies, mean_real_nn_distance, parameters, seed):
+    # Runs 1000 simulation rounds, or with adaptive_simulation only as many as
+    # are needed to tell on which side of the p_value_thresholds the p-value
+    # is (at least 100, at most max_simulation_rounds). The "_1000" columns
+    # then summarize all rounds that were run.
+    rng = np.random.default_rng(seed)
+    if parameters['adaptive_simulation']:
+        return simulate_until_significant(sampling_table, number_of_pbodies, mean_real_nn_distance, min_distance = parameters['min_sampling_distance'], rng = rng,
+                                          thresholds = parameters['p_value_thresholds'], confidence = parameters['p_value_confidence'], max_rounds = parameters['max_simulation_rounds'])
+    _, simulated_means = simulate_null_distribution(sampling_table, number_of_pbodies, 1000, min_distance = parameters['min_sampling_distance'], seed = rng)
+    return simulated_means
+
+
+def nn_uniform_sampling(images, parameters, seed=None, cache=None):
+    '''
+    Nearest neighbor distances of the P-bodies in the cytoplasm compared to
+    P-bodies sampled uniformly in the cytoplasm.
+
+    With null_model = 'clark_evans', the expected mean nearest neighbor
+    distance and the p-value are approximated analytically from the number of
+    P-bodies and the area and perimeter of the cytoplasm, and only the cells
+    close to a p_value_threshold are simulated. The simulated columns then
+    contain the expected distance and Number_of_simulation_rounds is 0.
+    '''
+    if cache is None:
+        cache = CellCache(images)
+    masks = cache.masks(parameters['dapi_threshold'])
+    cytoplasmic_mask = extract_sample_area(images['cellmask'], images['dapi'], parameters['dapi_threshold'], masks = masks)
+    pbodies = cache.pbodies(parameters['pbody_area_threshold'])
+    [in_cytoplasm] = classify_pbodies(pbodies, [cytoplasmic_mask])
+    centroids = pbodies[in_cytoplasm].tolist()
+    number_of_pbodies = len(centroids)
+    number_of_pbodies_in_nucleus = np.count_nonzero(~in_cytoplasm)
+    _check_nb_pbodies(number_of_pbodies, parameters)
+
+    # Calculate the real nearest neighbor distances
+    mean_real_nn_distance = np.mean(nearest_neighbor_distance(centroids))
+
+    # Calculate area of cytoplasm of the cell
+    cytoplasmic_area = np.sum(cytoplasmic_mask > 1)
+
+    if parameters['null_model'] == 'clark_evans':
+        # Analytic expectation for uniform sampling. Cells whose p-value is
+        # within clark_evans_margin of a threshold are simulated instead
+        perimeter = cache.get(('cytoplasm_perimeter', parameters['dapi_threshold']), lambda: mask_perimeter(cytoplasmic_mask))
+        expected_nn_distance, expected_std = clark_evans_mean_nn_distance(number_of_pbodies, cytoplasmic_area, perimeter)
+        p_value_measured_lower = norm.sf((mean_real_nn_distance - expected_nn_distance) / expected_std)
+        if all(abs(p_value_measured_lower - threshold) >= parameters['clark_evans_margin'] for threshold in parameters['p_value_thresholds']):
+            return [[number_of_pbodies, number_of_pbodies_in_nucleus, cytoplasmic_area, mean_real_nn_distance] + [expected_nn_distance] * 4 + [p_value_measured_lower] + _simulation_rounds(0, parameters)]
+    elif parameters['null_model'] != 'simulation':
+        raise ValueError('Unknown null_model ' + repr(parameters['null_model']) + ', use simulation or clark_evans')
+
+    # Run all simulation rounds at once. The summaries over 10, 100 and 1000
+    # rounds are taken from the first rounds of the same simulation
+    if parameters['adaptive_simulation']:
+        sampling_table = cache.cytoplasm_sampling_table(parameters['dapi_threshold'])
+        simulated_means = _simulate_mean_nn_distances(sampling_table, number_of_pbodies, mean_real_nn_distance, parameters, seed)
+    else:
+        # The same rounds as spatial_statistics, they are only simulated once
+        _, simulated_means = cache.uniform_simulation(parameters, number_of_pbodies, 1000, seed)
+
+    # Calculate P-value of measured vs. the simulations
+    p_value_measured_lower = np.mean(mean_real_nn_distance < simulated_means)
+
+    return [[number_of_pbodies, number_of_pbodies_in_nucleus, cytoplasmic_area, mean_real_nn_distance, simulated_means[0], np.mean(simulated_means[:10]), np.mean(simulated_means[:100]), np.mean(simulated_means), p_value_measured_lower] + _simulation_rounds(len(simulated_means), parameters)]
+
+
+def nn_volume_sampling(images, parameters, seed=None, cache=None):
+    '''
+    Nearest neighbor distances of all P-bodies compared to P-bodies sampled
+    proportionally to the smoothed protein signal (an estimate of the volume of
+    the cell)
+    '''
+    if cache is None:
+        cache = CellCache(images)
+    masks = cache.masks(parameters['dapi_threshold'])
+    cytoplasmic_mask = extract_sample_area(images['cellmask'], images['dapi'], parameters['dapi_threshold'], masks = masks)
+    centroids = cache.pbodies(parameters['pbody_area_threshold']).tolist()
+    number_of_pbodies = len(centroids)
+    _check_nb_pbodies(number_of_pbodies, parameters)
+
+    mean_real_nn_distance = np.mean(nearest_neighbor_distance(centroids))
+    cytoplasmic_area = np.sum(cytoplasmic_mask > 1)
+
+    # Get a smoothed Succs image to estimate the volume of the cell
+    sampling_table = cache.volume_sampling_table(parameters)
+
+    simulated_means = _simulate_mean_nn_distances(sampling_table, number_of_pbodies, mean_real_nn_distance, parameters, seed)
+    p_value_measured_lower = np.mean(mean_real_nn_distance < simulated_means)
+
+    # Calculate the mean protein intensity around P-bodies
+    [mean_protein_intensity_cytoplasm, mean_protein_intensity_pbodies] = cache.mean_intensities()
+
+    return [[number_of_pbodies, mean_protein_intensity_cytoplasm, mean_protein_intensity_pbodies, cytoplasmic_area, mean_real_nn_distance, simulated_means[0], np.mean(simulated_means[:10]), np.mean(simulated_means[:100]), np.mean(simulated_means), p_value_measured_lower] + _simulation_rounds(len(simulated_means), parameters)]
+
+
+def nn_area_sampling(images, parameters, seed=None, cache=None):
+    '''
+    Nearest neighbor distances of all P-bodies compared to P-bodies sampled
+    uniformly in the cytoplasm and with a low probability over the nucleus
+    '''
+    if cache is None:
+        cache = CellCache(images)
+    masks = cache.masks(parameters['dapi_threshold'])
+    cytoplasmic_mask = extract_sample_area(images['cellmask'], images['dapi'], parameters['dapi_threshold'], masks = masks)
+    centroids = cache.pbodies(parameters['pbody_area_threshold']).tolist()
+    number_of_pbodies = len(centroids)
+    _check_nb_pbodies(number_of_pbodies, parameters)
+
+    mean_real_nn_distance = np.mean(nearest_neighbor_distance(centroids))
+    cytoplasmic_area = np.sum(cytoplasmic_mask > 1)
+
+    def area_sampling_table():
+        cytoplasmic_mask_with_nucleus = add_nuclear_probability(cytoplasmic_mask, images['dapi'], nucleus_percentage = parameters['percentage_pbodies_in_nucleus'], nucleus_threshold = parameters['dapi_threshold'], shrink_nucleus = parameters['shrink_nucleus'], masks = masks)
+        return SamplingTable(cytoplasmic_mask_with_nucleus)
+    sampling_table = cache.get(('area_sampling_table', parameters['dapi_threshold'], parameters['percentage_pbodies_in_nucleus'], parameters['shrink_nucleus']), area_sampling_table)
+
+    simulated_means = _simulate_mean_nn_distances(sampling_table, number_of_pbodies, mean_real_nn_distance, parameters, seed)
+    p_value_measured_lower = np.mean(mean_real_nn_distance < simulated_means)
+
+    [mean_protein_intensity_cytoplasm, mean_protein_intensity_pbodies] = cache.mean_intensities()
+
+    return [[number_of_pbodies, mean_protein_intensity_cytoplasm, mean_protein_intensity_pbodies, cytoplasmic_area, mean_real_nn_distance, simulated_means[0], np.mean(simulated_means), p_value_measured_lower] + _simulation_rounds(len(simulated_means), parameters)]
+
+
+def protein_intensities(images, parameters, seed=None, cache=None):
+    '''
+    Mean protein intensity around the P-bodies compared to the intensity around
+    P-bodies sampled proportionally to the smoothed protein signal. The
+    dapi_threshold only changes the sampling area, the intensities are
+    measured outside the nucleus of INTENSITY_DAPI_THRESHOLD.
+    '''
+    if cache is None:
+        cache = CellCache(images)
+    masks = cache.masks(parameters['dapi_threshold'])
+    cytoplasmic_mask = extract_sample_area(images['cellmask'], images['dapi'], parameters['dapi_threshold'], masks = masks)
+    centroids = cache.pbodies(parameters['pbody_area_threshold']).tolist()
+    number_of_pbodies = len(centroids)
+    _check_nb_pbodies(number_of_pbodies, parameters)
+
+    cytoplasmic_area = np.sum(cytoplasmic_mask > 1)
+
+    # Get a smoothed Succs image to estimate the volume of the cell
+    sampling_table = cache.volume_sampling_table(parameters)
+
+    # The smoothed protein signal is computed once, the real and the simulated
+    # P-bodies are measured on the same image
+    protein_context = cache.protein_context()
+    [mean_protein_intensity_cytoplasm, mean_protein_intensity_pbodies] = cache.mean_intensities()
+
+    # The surroundings of the simulated P-bodies are looked up from their
+    # centroids, no mask is drawn
+    rng = np.random.default_rng(seed)
+    mean_of_multiple_simulation_rounds = []
+    for i in range(parameters['simulation_rounds']):
+        sampled_pbodies = sample_pbodies(sampling_table, number_of_pbodies, area_fn=lambda: parameters['simulated_pbody_area'], min_distance = parameters['min_sampling_distance'], rng = rng)
+        mean_of_multiple_simulation_rounds.append(protein_context.surround_mean_at(sampled_pbodies))
+
+    return [[number_of_pbodies, mean_protein_intensity_cytoplasm, mean_protein_intensity_pbodies, np.mean(mean_of_multiple_simulation_rounds), cytoplasmic_area]]
+
+
+def spatial_statistics(images, parameters, seed=None, cache=None):
+    '''
+    Mean nearest neighbor distance, G-function, Ripley's K and L and pair
+    correlation function of the P-bodies in the cytoplasm, each compared with
+    P-bodies sampled uniformly in the cytoplasm by a global envelope test (see
+    spatial_statistics.envelope_tests). All statistics use the same
+    simulation rounds, which are also those of nn_uniform_sampling.
+
+    Returns one row per radius (radius_step to max_radius) with the measured
+    functions and their envelopes. The mean nearest neighbor distance, its
+    envelope and the p-values of all statistics are the same in every row.
+    '''
+    if cache is None:
+        cache = CellCache(images)
+    masks = cache.masks(parameters['dapi_threshold'])
+    cytoplasmic_mask = extract_sample_area(images['cellmask'], images['dapi'], parameters['dapi_threshold'], masks = masks)
+    pbodies = cache.pbodies(parameters['pbody_area_threshold'])
+    [in_cytoplasm] = classify_pbodies(pbodies, [cytoplasmic_mask])
+    coordinates = np.stack([pbodies['x'][in_cytoplasm], pbodies['y'][in_cytoplasm]], axis=1)
+    number_of_pbodies = len(coordinates)
+    _check_nb_pbodies(number_of_pbodies, parameters)
+    cytoplasmic_area = np.sum(cytoplasmic_mask > 1)
+
+    simulated_coordinates, _ = cache.uniform_simulation(parameters, number_of_pbodies, parameters['simulation_rounds'], seed)
+    radii = np.arange(1, int(parameters['max_radius'] // parameters['radius_step']) + 1) * parameters['radius_step']
+    tests = envelope_tests(coordinates, simulated_coordinates, radii, cytoplasmic_area, alpha = parameters['envelope_alpha'])
+
+    mean_nn, p_value_mean_nn, mean_nn_lower, mean_nn_upper = tests['mean_nn']
+    p_values = [tests[statistic][1] for statistic in ['mean_nn', 'G', 'K', 'L', 'pcf']]
+    rows = []
+    for i, radius in enumerate(radii):
+        row = [number_of_pbodies, cytoplasmic_area, radius]
+        for statistic in ['G', 'K', 'L', 'pcf']:
+            measured, _, lower, upper = tests[statistic]
+            row += [measured[i], lower[i], upper[i]]
+        rows.append(row + [mean_nn, mean_nn_lower, mean_nn_upper] + p_values)
+    return rows
+
+
+def nn_distances(images, parameters, seed=None, cache=None):
+    '''
+    All individual nearest neighbor distances of the P-bodies of a cell (one
+    row per P-body). Used to define minimal observed nearest neighbor distance
+    '''
+    if cache is None:
+        cache = CellCache(images)
+    centroids = cache.pbodies(parameters['pbody_area_threshold']).tolist()
+    _check_nb_pbodies(len(centroids), parameters)
+
+    return [[distance] for distance in nearest_neighbor_distance(centroids)]
+
+
+def nucleus_counts(images, parameters, seed=None, cache=None):
+    '''
+    Number of P-bodies in the cytoplasm and over the nucleus, with a shrunken
+    and with a full nucleus
+    '''
+    if cache is None:
+        cache = CellCache(images)
+    masks = cache.masks(parameters['dapi_threshold'])
+    cytoplasmic_mask = extract_sample_area(images['cellmask'], images['dapi'], parameters['dapi_threshold'], shrink_nucleus = parameters['shrink_nucleus'], masks = masks)
+    cytoplasmic_mask_full_nucleus = extract_sample_area(images['cellmask'], images['dapi'], parameters['dapi_threshold'], shrink_nucleus = 0, masks = masks)
+
+    # Extract the P-bodies once and check them against both masks
+    pbodies = cache.pbodies(parameters['pbody_area_threshold'])
+    [in_cytoplasm, in_full_cytoplasm] = classify_pbodies(pbodies, [cytoplasmic_mask, cytoplasmic_mask_full_nucleus])
+
+    # Calculate area of cytoplasm of the cell
+    cytoplasmic_area = np.sum(cytoplasmic_mask > 1)
+
+    return [[np.count_nonzero(in_cytoplasm), np.count_nonzero(~in_cytoplasm), np.count_nonzero(in_full_cytoplasm), np.count_nonzero(~in_full_cytoplasm), cytoplasmic_area]]
+
+
+ANALYSES = {
+    'nn_uniform_sampling': Analysis(
+        function=nn_uniform_sampling,
+        image_types=['pbodies', 'dapi', 'cellmask'],
+        columns=['Number_of_pbodies', 'Number_of_pbodies_in_Nucleus', 'Area_of_Cytoplasm', 'Mean_nn_distances_measured', 'Mean_nn_distances_simulated', 'Mean_Of_mean_nn_distances_simulated_10', 'Mean_Of_mean_nn_distances_simulated_100', 'Mean_Of_mean_nn_distances_simulated_1000', 'p-value_measured_lower_1000_sim'],
+        output_prefix='NearestNeighborResults_',
+        parameters={**_shared_parameters('pbody_area_threshold', 'dapi_threshold', 'min_nb_pbodies'), 'min_sampling_distance': 6, 'null_model': 'simulation', 'clark_evans_margin': 0.05, **adaptive_simulation_parameters}),
+    'nn_volume_sampling': Analysis(
+        function=nn_volume_sampling,
+        image_types=['pbodies', 'dapi', 'cellmask', 'protein'],
+        columns=['Number_of_pbodies', 'Mean_protein_intensity_cytoplasm', 'Mean_protein_intensity_around_pbodies', 'Area_of_Cytoplasm', 'Mean_nn_distances_measured', 'Mean_nn_distances_simulated', 'Mean_Of_mean_nn_distances_simulated_10', 'Mean_Of_mean_nn_distances_simulated_100', 'Mean_Of_mean_nn_distances_simulated_1000', 'p-value_measured_lower_1000_sim'],
+        output_prefix='NearestNeighborResults_VolumeSampling_',
+        parameters={**_shared_parameters('pbody_area_threshold', 'dapi_threshold', 'min_nb_pbodies'), 'min_sampling_distance': 6, 'percentage_pbodies_in_nucleus': 0.07388, **adaptive_simulation_parameters}),
+    'nn_area_sampling': Analysis(
+        function=nn_area_sampling,
+        image_types=['pbodies', 'dapi', 'cellmask', 'protein'],
+        columns=['Number_of_pbodies', 'Mean_protein_intensity_cytoplasm', 'Mean_protein_intensity_around_pbodies', 'Area_of_Cytoplasm', 'Mean_nn_distances_measured', 'Mean_nn_distances_simulated', 'Mean_Of_mean_nn_distances_simulated_1000', 'p-value_measured_lower_1000_sim'],
+        output_prefix='NearestNeighborResults_AreaSampling',
+        parameters={**_shared_parameters('pbody_area_threshold', 'dapi_threshold', 'min_nb_pbodies'), 'min_sampling_distance': 6, 'percentage_pbodies_in_nucleus': 0.052, 'shrink_nucleus': 3, **adaptive_simulation_parameters}),
+    'protein_intensities': Analysis(
+        function=protein_intensities,
+        image_types=['pbodies', 'dapi', 'cellmask', 'protein'],
+        columns=['Number_of_pbodies', 'Mean_protein_intensity_cytoplasm', 'Mean_protein_intensity_around_pbodies', 'Mean_protein_intensity_around_simulated_pbodies', 'Area_of_Cytoplasm'],
+        output_prefix='Protein_intensities_',
+        parameters={**_shared_parameters('pbody_area_threshold', 'dapi_threshold', 'min_nb_pbodies'), 'min_sampling_distance': 6, 'percentage_pbodies_in_nucleus': 0.07388, 'simulation_rounds': 100, 'simulated_pbody_area': 40}),
+    'spatial_statistics': Analysis(
+        function=spatial_statistics,
+        image_types=['pbodies', 'dapi', 'cellmask'],
+        columns=['Number_of_pbodies', 'Area_of_Cytoplasm', 'Radius',
+                 'G_measured', 'G_envelope_lower', 'G_envelope_upper',
+                 'K_measured', 'K_envelope_lower', 'K_envelope_upper',
+                 'L_measured', 'L_envelope_lower', 'L_envelope_upper',
+                 'pcf_measured', 'pcf_envelope_lower', 'pcf_envelope_upper',
+                 'Mean_nn_distances_measured', 'Mean_nn_distances_envelope_lower', 'Mean_nn_distances_envelope_upper',
+                 'p-value_mean_nn', 'p-value_G', 'p-value_K', 'p-value_L', 'p-value_pcf'],
+        output_prefix='SpatialStatistics_',
+        parameters={**_shared_parameters('pbody_area_threshold', 'dapi_threshold', 'min_nb_pbodies'), 'min_sampling_distance': 6, 'simulation_rounds': 1000, 'max_radius': 100, 'radius_step': 5, 'envelope_alpha': 0.05}),
+    'nn_distances': Analysis(
+        function=nn_distances,
+        image_types=['pbodies'],
+        columns=['NearestNeighborDistance'],
+        output_prefix='AllNearestNeighborDistances_',
+        parameters=_shared_parameters('pbody_area_threshold', 'min_nb_pbodies')),
+    'nucleus_counts': Analysis(
+        function=nucleus_counts,
+        image_types=['pbodies', 'dapi', 'cellmask'],
+        columns=['Number_of_pbodies_cytoplasm', 'Number_of_pbodies_in_Nucleus', 'Number_of_pbodies_unshrunken_cytoplasm', 'Number_of_pbodies_unshrunken_Nucleus', 'Area_of_Cytoplasm'],
+        output_prefix='NumberPbodiesInNucleus_',
+        parameters={**_shared_parameters('pbody_area_threshold', 'dapi_threshold'), 'shrink_nucleus': 3}),
+}
+
+
+def result_columns(name, parameters):
+    '''
+    Returns the columns of the result rows of the analysis name with these
+    parameters: the columns in ANALYSES, and Number_of_simulation_rounds for
+    the nearest neighbor analyses with adaptive_simulation or the clark_evans
+    null model, whose cells do not all get the same number of rounds.
+    '''
+    columns = list(ANALYSES[name].columns)
+    if 'adaptive_simulation' in ANALYSES[name].parameters and _reports_simulation_rounds(parameters):
+        columns.append('Number_of_simulation_rounds')
+    return columns
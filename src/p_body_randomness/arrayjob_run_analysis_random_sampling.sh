@@ -8,6 +8,8 @@
 #SBATCH -e slurm_error-%j_%a.txt
 ### use (max) 2000 MB of memory per CPU
 #SBATCH --mem-per-cpu=3000m
+### the cells of a well are evaluated in parallel on all cores of the job
+#SBATCH --cpus-per-task=32
 
 n="$SLURM_ARRAY_TASK_ID"
 
@@ -26,4 +28,7 @@ fi
 # echo 1>&2 "Running in virtualenv '$venv', using python interpreter $(command -v python) ..."
 
 
-exec python run_improved_analysis_area_sampling_on_cluster.py $n
+# configuration of the analyses, relative to the repository root
+config="${1:-configs/run7_improved_analysis_area_sampling.toml}"
+
+exec p-body-randomness "$config" --well-index $n --workers $SLURM_CPUS_PER_TASK --verbose
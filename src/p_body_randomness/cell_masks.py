@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Masks of the compartments of a single cell (cell, nucleus, cytoplasm) and
+cropping of the images of a cell to its bounding box.
+
+Most steps of an analysis need the nucleus mask, which is computed by
+smoothing and thresholding the DAPI image. CellMasks computes every mask the
+first time it is needed and returns the same array afterwards, so a cell's
+DAPI image is only filtered once no matter how many steps use it.
+"""
+import numpy as np
+import cv2
+
+
+class CellMasks:
+    '''
+    Lazily computed masks of one cell.
+
+    Args:
+        cell_mask: Segmentation of the cell (non-zero inside the cell)
+        dapi_image: DAPI intensity image of the cell
+        dapi_threshold: Smoothed DAPI intensity above which a pixel is part
+            of the nucleus
+
+    All returned masks are cached and read-only, copy them before modifying.
+    '''
+
+    def __init__(self, cell_mask, dapi_image, dapi_threshold = 10):
+        self.cell_mask_image = cell_mask
+        self.dapi_image = dapi_image
+        self.dapi_threshold = dapi_threshold
+        self._masks = {}
+
+    def _memoize(self, key, compute):
+        if key not in self._masks:
+            mask = compute()
+            mask.flags.writeable = False
+            self._masks[key] = mask
+        return self._masks[key]
+
+    @property
+    def cell(self):
+        '''Boolean mask of the cell'''
+        return self._memoize('cell', lambda: self.cell_mask_image > 0)
+
+    @property
+    def nucleus(self):
+        '''Boolean mask of the nucleus, based on the smoothed DAPI image'''
+        def compute():
+            dapi_smoothed = cv2.GaussianBlur(self.dapi_image, (5, 5), 0)
+            return dapi_smoothed > self.dapi_threshold
+        return self._memoize('nucleus', compute)
+
+    def shrunken_nucleus(self, shrink_nucleus = 3):
+        '''uint8 mask of the nucleus eroded shrink_nucleus times'''
+        def compute():
+            kernel = np.ones((3, 3), np.uint8)
+            return cv2.erode(np.array(self.nucleus, dtype=np.uint8), kernel, iterations = shrink_nucleus)
+        return self._memoize(('shrunken_nucleus', shrink_nucleus), compute)
+
+    def cytoplasm(self, shrink_nucleus = 3):
+        '''
+        Mask of the cytoplasm (255 inside the cell but outside of the
+        nucleus shrunken by shrink_nucleus, 0 elsewhere)
+        '''
+        def compute():
+            return np.logical_xor(self.cell, self.shrunken_nucleus(shrink_nucleus)) * 255
+        return self._memoize(('cytoplasm', shrink_nucleus), compute)
+
+
+# Margin around the cell when cropping its images. It is larger than the
+# radius of the smoothing Gaussian (15 pixels) plus the DAPI blur, so the
+# pixels of the cell are processed the same as in the full image
+CROP_MARGIN = 20
+
+
+def cell_bounding_box(cell_mask, margin = CROP_MARGIN):
+    '''
+    Returns the bounding box (x_start, y_start, x_stop, y_stop) of the cell in
+    cell_mask, extended by margin pixels on all sides and clipped to the image.
+    An empty mask gives the whole image.
+    '''
+    rows = np.flatnonzero(np.any(cell_mask, axis=1))
+    columns = np.flatnonzero(np.any(cell_mask, axis=0))
+    if len(rows) == 0:
+        return 0, 0, cell_mask.shape[1], cell_mask.shape[0]
+    return (max(int(columns[0]) - margin, 0), max(int(rows[0]) - margin, 0),
+            min(int(columns[-1]) + 1 + margin, cell_mask.shape[1]), min(int(rows[-1]) + 1 + margin, cell_mask.shape[0]))
+
+
+def crop_to_cell(images, margin = CROP_MARGIN):
+    '''
+    Crops all images of a cell to the bounding box of its segmentation.
+
+    Args:
+        images: Dict image type: image of one cell, with a 'cellmask' image
+        margin: Pixels kept around the cell
+
+    Returns (cropped images, (offset_x, offset_y)). Add the offset to
+    coordinates in the cropped images to get coordinates in the full images.
+    '''
+    x_start, y_start, x_stop, y_stop = cell_bounding_box(images['cellmask'], margin)
+    cropped = {image_type: np.ascontiguousarray(image[y_start:y_stop, x_start:x_stop]) for image_type, image in images.items()}
+    return cropped, (x_start, y_start)
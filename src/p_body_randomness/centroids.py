@@ -10,30 +10,63 @@ import numpy as np
 
 import cv2
 
+from p_body_randomness.profiling import timer
 
-def extract_centroids(pbodies_image: np.ndarray, area_threshold=5):
-    centroid_list = []
+
+# Fields of the P-body tables returned by extract_pbodies
+PBODY_DTYPE = np.dtype([('x', np.int64), ('y', np.int64), ('area', np.float64)])
+
+
+@timer('extract_pbodies')
+def extract_pbodies(pbodies_image: np.ndarray, area_threshold=5):
+    '''
+    Extracts all P-bodies of a segmentation image from their outer contours.
+
+    The area of a P-body is cv2.contourArea of its outer contour and its
+    centroid is calculated from the moments of the contour (truncated to
+    integers), as in the original analysis. Holes inside a P-body are not
+    counted as P-bodies.
+
+    Returns:
+        A structured numpy array with the fields x, y (centroid) and area of
+        all P-bodies with an area larger than area_threshold, ordered by the
+        top left corner of their bounding box
+    '''
     # convert the grayscale image to binary image
     ret, pbodies_binary = cv2.threshold(pbodies_image, 127, 255, 0)
-    im2, contours, hierarchy = cv2.findContours(pbodies_binary, cv2.RETR_TREE,
-                                                cv2.CHAIN_APPROX_SIMPLE)
-    # Loop through all P bodies of the cell
-    for c in contours:
+    # findContours returns (image, contours, hierarchy) in OpenCV 3 and
+    # (contours, hierarchy) since OpenCV 4
+    contours = cv2.findContours(pbodies_binary.astype(np.uint8), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[-2]
+    areas = np.array([cv2.contourArea(contour) for contour in contours], dtype=np.float64)
+    large_enough = np.flatnonzero(areas > area_threshold)
+
+    pbodies = np.zeros(len(large_enough), dtype=PBODY_DTYPE)
+    for i, index in enumerate(large_enough.tolist()):
+        moments = cv2.moments(contours[index])
+        pbodies[i] = (int(moments['m10'] / moments['m00']), int(moments['m01'] / moments['m00']), areas[index])
 
-        # Calculate area of all P-bodies
-        curr_area = cv2.contourArea(c)
+    # The order of the contours depends on where the P-bodies are in the
+    # image, they are sorted by the top left corner of their bounding box
+    # instead so that cropping the image does not reorder them
+    boxes = np.array([cv2.boundingRect(contours[index]) for index in large_enough.tolist()], dtype=np.int64).reshape(-1, 4)
+    order = np.lexsort((pbodies['x'], boxes[:, 0], boxes[:, 1]))
 
-        # Filter out the P-bodies with an area smaller than
-        if curr_area > area_threshold:
-            # calculate moments for each contour
-            M = cv2.moments(c)
+    return pbodies[order]
 
-            # calculate x,y coordinate of center
-            cX = int(M["m10"] / M["m00"])
-            cY = int(M["m01"] / M["m00"])
-            centroid_list.append((cX, cY, curr_area))
 
-    return centroid_list
+def classify_pbodies(pbodies: np.ndarray, sample_masks: list):
+    '''
+    Checks which P-bodies (as returned by extract_pbodies) have their centroid
+    inside of each of the sample_masks.
+
+    Returns:
+        A list with one boolean numpy array per mask
+    '''
+    return [np.asarray(sample_mask)[pbodies['y'], pbodies['x']] > 0 for sample_mask in sample_masks]
+
+
+def extract_centroids(pbodies_image: np.ndarray, area_threshold=5):
+    return extract_pbodies(pbodies_image, area_threshold).tolist()
 
 
 def generate_centroids_mask(centroid_list: list, mask_shape=(640, 640)):
@@ -54,35 +87,10 @@ def extract_centroids_in_sample_area(pbodies_image: np.ndarray,
                                      sample_mask: np.ndarray,
                                      area_threshold=5):
     # Extract the centroids of P bodies inside and outside the sample mask
-    centroid_list_in_area = []
-    centroid_list_outside_area = []
-    sample_mask_binary = sample_mask > 0
-    # convert the grayscale image to binary image
-    ret, pbodies_binary = cv2.threshold(pbodies_image, 127, 255, 0)
-    im2, contours, hierarchy = cv2.findContours(pbodies_binary, cv2.RETR_TREE,
-                                                cv2.CHAIN_APPROX_SIMPLE)
-    # Loop through all P bodies of the cell
-    for c in contours:
-
-        # Calculate area of all P-bodies
-        curr_area = cv2.contourArea(c)
-
-        # Filter out the P-bodies with an area smaller than
-        if curr_area > area_threshold:
-            # calculate moments for each contour
-            M = cv2.moments(c)
-
-            # calculate x,y coordinate of center
-            cX = int(M["m10"] / M["m00"])
-            cY = int(M["m01"] / M["m00"])
-
-            # If centroids are in sample mask, add them to centroid_list_in_area
-            if sample_mask_binary[cY, cX]:
-                centroid_list_in_area.append((cX, cY, curr_area))
-            else:
-                centroid_list_outside_area.append((cX, cY, curr_area))
-
-    return [centroid_list_in_area, centroid_list_outside_area]
+    pbodies = extract_pbodies(pbodies_image, area_threshold)
+    [in_area] = classify_pbodies(pbodies, [sample_mask])
+
+    return [pbodies[in_area].tolist(), pbodies[~in_area].tolist()]
 
 
 if __name__ == '__main__':
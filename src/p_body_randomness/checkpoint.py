@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Checkpoints of the results of long running well jobs.
+
+The results of every cell are committed to a SQLite file as soon as the cell
+is evaluated. If a job is preempted or killed, the next run of the same well
+reads the completed cells from the checkpoint and only evaluates the others.
+Results are keyed by (well, site_x, site_y, label, analysis, parameters hash),
+so changing the parameters of an analysis, the seed or the cropping of the
+images recomputes it.
+"""
+import hashlib
+import json
+import logging
+import sqlite3
+
+import numpy as np
+
+_logger = logging.getLogger(__name__)
+
+
+def parameters_hash(parameters, seed=None, data=None):
+    '''
+    Returns a short hash of the parameters of an analysis, the seed of the run
+    and the data settings that change the results (e.g. the cropping of the
+    images), the results of a cell are reused only if all are unchanged
+    '''
+    key = json.dumps({'parameters': parameters, 'seed': seed, 'data': data}, sort_keys=True, default=_json_value)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+
+
+def _json_value(value):
+    # numpy scalars (e.g. counts returned by np.sum) are not JSON serializable
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError('Cannot store ' + repr(value) + ' in a checkpoint')
+
+
+class CheckpointStore:
+    '''
+    Append-only store of the result rows of cells in a SQLite file.
+
+    Every call of add is committed immediately, so everything that was added
+    before a job was killed is still there when it is restarted. Only one
+    process should write to a store at a time (e.g. one file per well).
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self._connection = sqlite3.connect(path)
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS results ('
+            'well TEXT, site_x INTEGER, site_y INTEGER, label TEXT, '
+            'analysis TEXT, parameters_hash TEXT, rows TEXT, '
+            'PRIMARY KEY (well, site_x, site_y, label, analysis, parameters_hash))')
+        self._connection.commit()
+
+    def completed_cells(self, well, analysis, parameters_hash):
+        '''
+        Returns the set of (well, site_x, site_y, label) of the cells of well
+        that have results for the analysis with these parameters
+        '''
+        cursor = self._connection.execute(
+            'SELECT well, site_x, site_y, label FROM results WHERE well = ? AND analysis = ? AND parameters_hash = ?',
+            (well, analysis, parameters_hash))
+        return set(cursor.fetchall())
+
+    def add(self, cell, results):
+        '''
+        Stores and commits the results of one cell.
+
+        Args:
+            cell: (well, site_x, site_y, label) of the cell
+            results: List of (analysis name, parameters hash, result rows). An
+                empty list of rows (the analysis skipped the cell) also counts
+                as completed.
+        '''
+        well, site_x, site_y, label = cell
+        with self._connection:
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [(well, int(site_x), int(site_y), str(label), name, run_hash, json.dumps(rows, default=_json_value))
+                 for name, run_hash, rows in results])
+
+    def rows(self, cells, analysis, parameters_hash):
+        '''
+        Yields the stored result rows of the analysis for cells (a list of
+        (well, site_x, site_y, label)), as (cell, list of rows) in the order
+        of cells. Cells without results are skipped.
+        '''
+        for cell in cells:
+            well, site_x, site_y, label = cell
+            stored = self._connection.execute(
+                'SELECT rows FROM results WHERE well = ? AND site_x = ? AND site_y = ? AND label = ? AND analysis = ? AND parameters_hash = ?',
+                (well, int(site_x), int(site_y), str(label), analysis, parameters_hash)).fetchone()
+            if stored is not None:
+                yield cell, json.loads(stored[0])
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
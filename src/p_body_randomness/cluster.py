@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Shared defaults and the parallel driver for running the analyses on the
+Pelkmanslab slurm cluster. The cells of a well are evaluated in parallel on
+all cores that were assigned to the job
+"""
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+_logger = logging.getLogger(__name__)
+
+wells = ['C03', 'C04', 'C05', 'C06', 'C07', 'C08', 'C09', 'C10', 'C11', 'C12', 'C13', 'C14', 'C15', 'C16',
+         'D03', 'D04', 'D05', 'D06', 'D07', 'D08', 'D09', 'D10', 'D11', 'D12', 'D13', 'D14', 'D15', 'D16',
+         'E04', 'E05', 'E06', 'E07', 'E08', 'F04', 'F05', 'F06', 'F07', 'F08']
+
+image_types = {'pbodies': '13_Pbody_Segm', 'protein': '13_Succs', 'cellmask': 'segmentation', 'dapi': '2_DAPI'}
+subfolders = {'pbodies': 'singleCellImages_PbodySegmentation', 'protein': 'singleCellImages', 'cellmask': 'singleCellSegmentations', 'dapi': 'singleCellImages'}
+base_path = '/data/active/jluethi/20180503-SubcellularLocalizationMultiplexing'
+TEMPLATE_FILENAME = '20180606-SLP_Multiplexing_p1_C03_x00{x}_y00{y}_z000_t000_{image_type}_Label{label}.png'
+
+
+class TooFewPbodiesException(Exception):
+    pass
+
+
+def default_nb_workers():
+    '''
+    Returns the number of cores this process may run on (on the cluster, the
+    number of cores assigned to the job instead of all cores of the node)
+    '''
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count()
+
+
+def cell_seed_sequence(entropy, cell):
+    '''
+    Returns the SeedSequence of the random stream of a cell.
+
+    The stream is derived from the entropy of the run and the cell
+    (well, site_x, site_y, label) itself, not from its position in the list of
+    cells. A cell gets the same stream whether it is evaluated with all other
+    cells of the plate or rerun on its own, and different cells get
+    independent streams.
+    '''
+    well, site_x, site_y, label = cell
+    well_key = (len(well),) + tuple(ord(character) for character in well)
+    return np.random.SeedSequence(entropy, spawn_key=well_key + (int(site_x), int(site_y), int(label)))
+
+
+def run_cells(evaluate_site, cells, nb_workers=None, seed=None, ordered=True):
+    '''
+    Evaluates cells in a process pool.
+
+    Args:
+        evaluate_site: Function called as evaluate_site(well, site_x, site_y,
+            label, seed=seed). It has to be picklable (e.g. defined at module
+            level) so that it can be sent to the worker processes. It can
+            return None or raise a TooFewPbodiesException to skip a cell.
+        cells: List of (well, site_x, site_y, label) tuples
+        nb_workers: Number of worker processes, all available cores by default
+        seed: Seed (entropy) of the random streams of the cells, see
+            cell_seed_sequence. None uses fresh entropy, which is logged so
+            that the run can be repeated.
+        ordered: If True, the cells are yielded in the order of cells no
+            matter which worker finished first. Otherwise every cell is
+            yielded as soon as it is evaluated (e.g. to checkpoint it before
+            a slower cell that was started earlier is done).
+
+    Yields (site_x, site_y, label, results) of every evaluated cell
+    '''
+    if nb_workers is None:
+        nb_workers = default_nb_workers()
+    entropy = np.random.SeedSequence(seed).entropy
+    if seed is None:
+        _logger.info('Seeding the simulations with the fresh entropy %d', entropy)
+
+    with ProcessPoolExecutor(max_workers=nb_workers) as executor:
+        futures = {executor.submit(_evaluate_cell, evaluate_site, cell, cell_seed_sequence(entropy, cell)): cell for cell in cells}
+        for future in (futures if ordered else as_completed(futures)):
+            results = future.result()
+            if results is not None:
+                yield tuple(futures[future][1:]) + (results,)
+
+
+def _evaluate_cell(evaluate_site, cell, seed):
+    # Code that uses the global numpy random state instead of a Generator
+    # seeded with seed gets the independent stream of the cell as well
+    np.random.seed(seed.generate_state(4))
+    try:
+        return evaluate_site(*cell, seed=seed)
+    except TooFewPbodiesException:
+        return None
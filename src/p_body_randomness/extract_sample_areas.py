@@ -3,29 +3,26 @@
 """
 Creates the mask of where the Monte Carlo simulation should sample the P-bodies
 """
-import numpy as np
-import cv2
+from p_body_randomness.cell_masks import CellMasks
+from p_body_randomness.profiling import timer
 
-def extract_sample_area(cell_mask, dapi_image, dapi_threshold = 10, shrink_nucleus = 3):
+
+@timer('extract_sample_area')
+def extract_sample_area(cell_mask, dapi_image, dapi_threshold = 10, shrink_nucleus = 3, masks = None):
     '''
     Returns a binary mask of where sampling is possible (inside the cell border,
     NOT inside the nucleus => in the cytoplasm of the cells)
     Dapi Threshold is used to define the nucleus based on the dapi intensity image
     shrink_nucleus: Int. Amount that nucleus is shrunken to avoid loosing P-bodies there
+    masks: CellMasks of the cell to reuse, its dapi_threshold replaces dapi_threshold.
+    The returned mask is read-only.
     '''
-    cell_mask_binary = cell_mask > 0
-    # Make a mask of the nucleus based on smoothed dapi_image
-    dapi_smoothed = cv2.GaussianBlur(dapi_image,(5,5),0)
-    nucleus_segmented = dapi_smoothed > dapi_threshold
-
-    # Shrink nucleus by shrink_nucleus value
-    kernel = np.ones((3,3),np.uint8)
-    shrunken_nucleus = cv2.erode(np.array(nucleus_segmented, dtype=np.uint8),kernel,iterations = shrink_nucleus)
-
-    # Combine the masks using XOR: creates a mask of the cytoplasm
-    cytoplasm_mask = np.logical_xor(cell_mask_binary, shrunken_nucleus) * 255
+    if masks is None:
+        masks = CellMasks(cell_mask, dapi_image, dapi_threshold)
 
-    return cytoplasm_mask
+    # The nucleus is segmented on the smoothed dapi image and shrunken by
+    # shrink_nucleus, XOR with the cell mask gives the cytoplasm
+    return masks.cytoplasm(shrink_nucleus)
 
 
 # cell_img_path = '/Users/Joel/p-body-randomness/data/input_data/20180606-SLP_Multiplexing_p1_C03_x000_y000_z000_t000_segmentation_Label12.png'
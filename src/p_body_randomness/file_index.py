@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Index of the single cell images of a plate.
+
+The image folders are listed once and every file name is parsed with the
+filename template into (well, site_x, site_y, label, image_type). The index
+can be cached to disk, it is rebuilt when the settings or the image folders
+change.
+"""
+import json
+import logging
+import os
+import re
+from string import Formatter
+
+_logger = logging.getLogger(__name__)
+
+# Regular expressions of the fields of the filename template
+_FIELD_PATTERNS = {
+    'well': r'(?P<well>[A-Za-z0-9]+?)',
+    'x': r'(?P<x>\d+)',
+    'y': r'(?P<y>\d+)',
+    'label': r'(?P<label>\d+)',
+}
+
+
+def template_regex(template, image_type_names):
+    '''
+    Compiles a regex that parses file names created with template.
+    image_type_names: The values the {image_type} field can take
+    '''
+    pattern = ''
+    for literal, field, _, _ in Formatter().parse(template):
+        pattern += re.escape(literal)
+        if field is None:
+            continue
+        if field == 'image_type':
+            names = sorted(set(image_type_names), key=len, reverse=True)
+            pattern += '(?P<image_type>' + '|'.join(re.escape(name) for name in names) + ')'
+        elif field in _FIELD_PATTERNS:
+            pattern += _FIELD_PATTERNS[field]
+        else:
+            raise ValueError('Unknown field {' + field + '} in the filename template')
+    return re.compile(pattern + '$')
+
+
+def build_file_index(data):
+    '''
+    Lists every image folder once and parses all file names.
+
+    Args:
+        data: Data settings with base_path, filename_template, image_types
+            and subfolders (see pipeline.get_settings)
+
+    Returns a dict (well, site_x, site_y, label, image_type): path. well is
+    None if the template has no {well} field, image_type is the key of
+    data['image_types'] (e.g. 'cellmask').
+    '''
+    regex = template_regex(data['filename_template'], data['image_types'].values())
+
+    # Several image types can share a folder, every folder is listed once
+    image_types_per_folder = {}
+    for image_type, subfolder in data['subfolders'].items():
+        image_types_per_folder.setdefault(subfolder, {})[data['image_types'][image_type]] = image_type
+
+    index = {}
+    for subfolder, image_types in image_types_per_folder.items():
+        folder = os.path.join(data['base_path'], subfolder)
+        for filename in os.listdir(folder):
+            match = regex.match(filename)
+            if match is None or match.group('image_type') not in image_types:
+                continue
+            fields = match.groupdict()
+            key = (fields.get('well'), int(fields['x']), int(fields['y']), fields['label'], image_types[fields['image_type']])
+            index[key] = os.path.join(folder, filename)
+    return index
+
+
+def _folder_mtimes(data):
+    mtimes = {}
+    for subfolder in set(data['subfolders'].values()):
+        mtimes[subfolder] = os.stat(os.path.join(data['base_path'], subfolder)).st_mtime
+    return mtimes
+
+
+def _cache_key(data):
+    return {key: data[key] for key in ['base_path', 'filename_template', 'image_types', 'subfolders']}
+
+
+def load_file_index(data, cache_path=None):
+    '''
+    Returns the file index (see build_file_index). If cache_path is given, the
+    index is read from it if it is still up to date, otherwise it is rebuilt
+    and written there.
+    '''
+    if cache_path is not None and os.path.exists(cache_path):
+        with open(cache_path) as cache_file:
+            cache = json.load(cache_file)
+        if cache['settings'] == _cache_key(data) and cache['mtimes'] == _folder_mtimes(data):
+            _logger.info('Using the cached file index %s', cache_path)
+            return {tuple(entry[:5]): entry[5] for entry in cache['entries']}
+        _logger.info('The cached file index %s is outdated', cache_path)
+
+    mtimes = _folder_mtimes(data)
+    index = build_file_index(data)
+    if cache_path is not None:
+        cache = {
+            'settings': _cache_key(data),
+            'mtimes': mtimes,
+            'entries': [list(key) + [path] for key, path in index.items()],
+        }
+        with open(cache_path, 'w') as cache_file:
+            json.dump(cache, cache_file)
+    return index
+
+
+def find_cells(index, well, image_types=('cellmask',)):
+    '''
+    Lists the cells of a well that have images of all image_types.
+
+    Returns a list of (well, site_x, site_y, label) tuples sorted by site and label
+    '''
+    cells = set()
+    for (index_well, site_x, site_y, label, image_type) in index:
+        if image_type == 'cellmask' and index_well in (well, None):
+            cells.add((index_well, site_x, site_y, label))
+
+    complete_cells = []
+    for cell in sorted(cells, key=lambda cell: (cell[1], cell[2], int(cell[3]))):
+        missing = [image_type for image_type in image_types if cell + (image_type,) not in index]
+        if missing:
+            _logger.warning('Skipping %s: %s%s, Label %s, missing images: %s', well, cell[1], cell[2], cell[3], ', '.join(missing))
+            continue
+        complete_cells.append((well,) + cell[1:])
+    return complete_cells
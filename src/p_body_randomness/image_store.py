@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Store of the single cell images as memory-mapped numpy arrays.
+
+Decoding the PNGs of every cell again for every run is slow, especially from
+a network filesystem. pack_images converts them once. Every cell is cropped
+to the bounding box of its segmentation plus a margin (see
+cell_masks.crop_to_cell), and the crops of all cells of a site are
+concatenated into one flat uint8 .npy file. A JSON file lists the labels,
+image types and, per cell, the position of its crop in the file, its shape
+and its offset in the full images. ImageStore memory-maps these files, so
+loading a cell reads the arrays without decoding or copying.
+"""
+import json
+import logging
+import os
+
+import numpy as np
+import cv2
+
+from p_body_randomness.cell_masks import CROP_MARGIN, crop_to_cell
+
+_logger = logging.getLogger(__name__)
+
+
+def _site_name(well, site_x, site_y):
+    return '{}_x{}_y{}'.format(well, site_x, site_y)
+
+
+def pack_site(store_path, cells, file_index, image_types, margin = CROP_MARGIN):
+    '''
+    Packs the images of the cells of one site into the store.
+
+    Args:
+        store_path: Folder of the store
+        cells: List of (well, site_x, site_y, label) of the cells of the site
+        file_index: Index of the images (see file_index.load_file_index)
+        image_types: List of the image types to pack (e.g. ['pbodies', 'dapi']),
+            it has to contain 'cellmask'
+        margin: Pixels kept around every cell
+    '''
+    if 'cellmask' not in image_types:
+        raise ValueError('Packing images requires the cellmask image type to crop the cells')
+    well, site_x, site_y = cells[0][:3]
+    crops = []
+    cell_metadata = []
+    start = 0
+    for cell in cells:
+        images = {}
+        for image_type in image_types:
+            index_well = well if cell + (image_type,) in file_index else None
+            path = file_index[(index_well,) + cell[1:] + (image_type,)]
+            images[image_type] = cv2.imread(path, 0)
+            if images[image_type] is None:
+                raise IOError('Could not read image ' + path)
+        cropped, offset = crop_to_cell(images, margin)
+        crop = np.stack([cropped[image_type] for image_type in image_types])
+        crops.append(crop.ravel())
+        cell_metadata.append({'start': start, 'shape': list(crop.shape[1:]), 'offset': list(offset)})
+        start += crop.size
+
+    name = _site_name(well, site_x, site_y)
+    np.save(os.path.join(store_path, name + '.npy'), np.concatenate(crops))
+    with open(os.path.join(store_path, name + '.json'), 'w') as metadata_file:
+        json.dump({'labels': [cell[3] for cell in cells], 'image_types': list(image_types), 'margin': margin, 'cells': cell_metadata}, metadata_file)
+
+
+def pack_images(store_path, cells, file_index, image_types, margin = CROP_MARGIN):
+    '''
+    Packs the images of cells (list of (well, site_x, site_y, label), e.g.
+    from file_index.find_cells) into the store, one file per site, cropped to
+    the cells plus margin pixels.
+    '''
+    os.makedirs(store_path, exist_ok=True)
+    cells_per_site = {}
+    for cell in cells:
+        cells_per_site.setdefault(cell[:3], []).append(cell)
+    for site, site_cells in cells_per_site.items():
+        _logger.info('Packing %d cells of site %s', len(site_cells), _site_name(*site))
+        pack_site(store_path, site_cells, file_index, image_types, margin)
+
+
+class ImageStore:
+    '''
+    Reads cells from a store created with pack_images. The files of a site are
+    memory-mapped the first time one of its cells is loaded. The images are
+    the crops of the cells, see load.
+    '''
+
+    def __init__(self, store_path):
+        self.store_path = store_path
+        self._sites = {}
+
+    def _open_site(self, well, site_x, site_y):
+        site = (well, site_x, site_y)
+        if site not in self._sites:
+            name = _site_name(well, site_x, site_y)
+            with open(os.path.join(self.store_path, name + '.json')) as metadata_file:
+                metadata = json.load(metadata_file)
+            pixels = np.load(os.path.join(self.store_path, name + '.npy'), mmap_mode='r')
+            labels = {label: cell for label, cell in zip(metadata['labels'], metadata['cells'])}
+            image_types = {image_type: j for j, image_type in enumerate(metadata['image_types'])}
+            self._sites[site] = (pixels, labels, image_types, metadata['margin'])
+        return self._sites[site]
+
+    def load(self, well, site_x, site_y, label, image_types, return_offset = False, margin = None):
+        '''
+        Returns a dict image type: read-only image of the cell, cropped to the
+        cell plus the margin of pack_images. With return_offset, returns
+        (images, (offset_x, offset_y)) as cell_masks.crop_to_cell. If margin
+        is given, raises a ValueError if the cell was packed with another
+        margin.
+        '''
+        pixels, labels, stored_types, stored_margin = self._open_site(well, site_x, site_y)
+        if margin is not None and margin != stored_margin:
+            raise ValueError('The image store was packed with a crop margin of ' + str(stored_margin) + ', not ' + str(margin)
+                             + ', pack the images again with the crop_margin of the configuration')
+        if label not in labels:
+            raise KeyError('Label ' + str(label) + ' is not in the image store for ' + _site_name(well, site_x, site_y))
+        missing = [image_type for image_type in image_types if image_type not in stored_types]
+        if missing:
+            raise KeyError('The image store does not contain the image types ' + ', '.join(missing))
+        cell = labels[label]
+        height, width = cell['shape']
+        crops = pixels[cell['start']:cell['start'] + len(stored_types) * height * width].reshape(len(stored_types), height, width)
+        images = {image_type: crops[stored_types[image_type]] for image_type in image_types}
+        if return_offset:
+            return images, tuple(cell['offset'])
+        return images
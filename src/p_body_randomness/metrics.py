@@ -2,6 +2,10 @@
 Calculate different metrics.
 '''
 import numpy as np
+import cv2
+from scipy.spatial import cKDTree
+
+from p_body_randomness.profiling import timer
 
 
 def eucledian_distance(coordinates1: tuple, coordinates2: tuple):
@@ -16,30 +20,104 @@ def eucledian_distance(coordinates1: tuple, coordinates2: tuple):
     return np.sqrt(distanceSum)
 
 
-def nearest_neighbor_distance(pBodylist: list):
+@timer('nearest_neighbor_distance')
+def nearest_neighbor_distance(pBodylist, exclude_coincident=True):
     '''
     Function: for each p-body in a list, calculates the distance to its nearest neighbor.
-    Input:    a list of tuples, where a tuple is of format: (xCoord, yCoord, area) for each p-body.
-    Output:   a list of distances to nearest neighbors.
+    Input:    a list of tuples, where a tuple is of format: (xCoord, yCoord, area) for each p-body
+              (or a numpy array with the coordinates in its first two columns).
+              exclude_coincident: if True, p-bodies at exactly the same position are not
+              treated as neighbors of each other and the distance to the nearest p-body at a
+              different position is returned for them. If False, their distance is 0.
+    Output:   a numpy array of distances to nearest neighbors.
+    Raises a ValueError if a p-body has no neighbor (fewer than 2 p-bodies, or
+    only coincident p-bodies when they are excluded).
     '''
+    coordinates = _coordinates(pBodylist)
+    if len(coordinates) == 0:
+        return np.zeros(0)
+    if len(coordinates) == 1:
+        raise ValueError('Nearest neighbor distances need at least 2 p-bodies')
 
-    # Creating a distance matrix.
-    pairwiseDistances = np.zeros((len(pBodylist), len(pBodylist)))
-
-    # Going through all p-bodies one by one.
-    for i in range(len(pBodylist)-1):
-        for j in range(i+1, len(pBodylist)):
-            # Calculating Eucledian distance.
-            distance = eucledian_distance(pBodylist[i][:2], pBodylist[j][:2])
-            # Filling up distance matrix.
-            pairwiseDistances[i, j] = distance
-            pairwiseDistances[j, i] = distance
+    # Querying 2 neighbors because the closest one is always the p-body itself.
+    tree = cKDTree(coordinates)
+    distances, _ = tree.query(coordinates, k=2)
+    nearestNeighbors = distances[:, 1]
 
-    # List containig all minimal distances.
-    nearestNeighbors = []
-    # Selecting minimum distances.
-    for pBody in pairwiseDistances:
-        nearestNeighbors.append(min(pBody[pBody > 0]))
+    if exclude_coincident:
+        coincident = nearestNeighbors == 0
+        if coincident.any():
+            # Only the few coincident p-bodies need a query over all neighbors.
+            all_distances, _ = tree.query(coordinates[coincident], k=len(coordinates))
+            all_distances[all_distances == 0] = np.inf
+            distinct_neighbors = all_distances.min(axis=1)
+            if np.isinf(distinct_neighbors).any():
+                raise ValueError('All p-bodies are at the same position')
+            nearestNeighbors[coincident] = distinct_neighbors
 
-    # Returning list of distances to the nearest neighbors.
     return nearestNeighbors
+
+
+@timer('mean_nearest_neighbor_distances')
+def mean_nearest_neighbor_distances(coordinates, chunk_size=None):
+    '''
+    Function: calculates the mean nearest neighbor distance of many p-body patterns at once.
+    Input:    a numpy array of shape (rounds, n, 2) with the (x, y) coordinates of n p-bodies
+              in each of the rounds. Coincident p-bodies are excluded as neighbors
+              (see nearest_neighbor_distance).
+              chunk_size: number of rounds whose distance matrices are computed together.
+              By default it is chosen to keep the matrices at a few million entries.
+    Output:   a numpy array with the mean nearest neighbor distance of every round.
+    '''
+    coordinates = np.asarray(coordinates, dtype=np.float64)
+    rounds, n = coordinates.shape[:2]
+    if chunk_size is None:
+        chunk_size = max(1, 4000000 // max(n * n, 1))
+
+    means = np.zeros(rounds)
+    for start in range(0, rounds, chunk_size):
+        chunk = coordinates[start:start + chunk_size]
+        differences = chunk[:, :, np.newaxis, :] - chunk[:, np.newaxis, :, :]
+        distances = np.sqrt(np.sum(differences ** 2, axis=-1))
+        # The diagonal and coincident p-bodies are not neighbors
+        distances[distances == 0] = np.inf
+        means[start:start + chunk_size] = distances.min(axis=2).mean(axis=1)
+
+    return means
+
+
+def clark_evans_mean_nn_distance(n, area, perimeter):
+    '''
+    Function: expected mean nearest neighbor distance of n p-bodies placed uniformly at random
+              in a region (Clark & Evans 1954), with the edge correction of Donnelly (1978)
+              for p-bodies close to the border of the region.
+    Input:    n: number of p-bodies
+              area: area of the region in pixels
+              perimeter: length of the border of the region in pixels (including the border of
+              holes, e.g. the nucleus in the cytoplasm, see mask_perimeter)
+    Output:   a tuple (expected mean nearest neighbor distance, its standard deviation).
+              The approximation ignores a minimal distance between p-bodies and is less exact
+              for very few p-bodies or elongated regions.
+    '''
+    expected = 0.5 * np.sqrt(area / n) + (0.0514 + 0.041 / np.sqrt(n)) * perimeter / n
+    variance = 0.0703 * area / n ** 2 + 0.037 * perimeter * np.sqrt(area / n ** 5)
+    return expected, np.sqrt(variance)
+
+
+def mask_perimeter(mask):
+    '''
+    Function: calculates the length of the border of the non-zero region of a mask.
+    Input:    a 2D mask
+    Output:   the summed length of the outer borders and of the borders of holes in pixels.
+    '''
+    contours, _ = cv2.findContours(np.asarray(mask > 0, dtype=np.uint8), cv2.RETR_LIST, cv2.CHAIN_APPROX_NONE)
+    return sum(cv2.arcLength(contour, True) for contour in contours)
+
+
+def _coordinates(pBodylist):
+    '''
+    Returns the (x, y) coordinates of a list of p-bodies as a float numpy array.
+    '''
+    if isinstance(pBodylist, np.ndarray):
+        return np.asarray(pBodylist[:, :2], dtype=np.float64)
+    return np.array([pBody[:2] for pBody in pBodylist], dtype=np.float64).reshape(-1, 2)
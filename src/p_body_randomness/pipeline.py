@@ -0,0 +1,570 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Entry point that runs the analyses of p_body_randomness.analyses on the
+single cell images of a plate. It is installed as the console script
+`p-body-randomness`:
+
+    p-body-randomness configs/run7_improved_analysis_area_sampling.toml --well-index 0
+
+The configuration is a TOML (or, if PyYAML is installed, a YAML) file:
+
+    [data]
+    base_path = "/path/to/the/plate"
+    filename_template = "..._{well}_x00{x}_y00{y}_z000_t000_{image_type}_Label{label}.png"
+
+    # Optional cache of the list of images
+    file_index = "/path/to/the/results/file_index.json"
+    # Optional store of the images, created with --pack-images. It holds the
+    # images cropped to the cells plus crop_margin pixels
+    image_store = "/path/to/the/image_store"
+
+    # The images of a cell are cropped to its bounding box plus crop_margin
+    # pixels before they are analysed (enabled by default)
+    crop_to_cell = true
+    crop_margin = 20
+
+    [output]
+    path = "/path/to/the/results"
+    # Commit the results of every cell to path/checkpoints/<well>.sqlite and
+    # skip the cells that are already there when a well is run again
+    checkpoint = true
+    # Write the time per stage, sampler counters and peak memory of every
+    # cell to Profile_<well>.jsonl and a summary to ProfileSummary_<well>.json
+    # (also enabled with --profile)
+    profile = false
+    # Also write the results to a Parquet dataset shared by all runs,
+    # partitioned by run (the name of path by default) and well, see
+    # results.load_results (requires pyarrow)
+    dataset = "/path/to/the/results_dataset"
+    run = "run7_improved_analysis_area_sampling"
+
+    # Parameters for all analyses that use them
+    [parameters]
+    dapi_threshold = 10
+
+    # Every table in analyses selects an analysis, its keys override parameters
+    [analyses.nn_area_sampling]
+    min_sampling_distance = 6
+
+    # Optional parameter sweep: every combination of these values is
+    # evaluated on every cell and all results are written to one long table
+    # per well (ParameterSweep_<well>.csv)
+    [sweep]
+    min_sampling_distance = [4, 6, 8]
+    dapi_threshold = [8, 10, 12]
+
+The images of a cell are loaded once and all selected analyses (and all
+parameter combinations of a sweep) are computed on them. Masks, P-bodies and
+sampling tables are computed once per cell and the parameters they depend
+on. Every analysis writes one result CSV per well. With checkpoint
+enabled, a job that was killed continues where it stopped when it is
+restarted.
+
+With --pack-images, the images of the selected wells are converted into the
+memory-mapped image_store instead, all later runs read the images from there.
+"""
+
+import argparse
+import json
+import sys
+import logging
+import numbers
+import os
+from functools import partial
+from itertools import product
+
+import cv2
+
+from p_body_randomness import __version__
+from p_body_randomness import cluster
+from p_body_randomness.analyses import ANALYSES, CellCache, result_columns
+from p_body_randomness.cell_masks import CROP_MARGIN, crop_to_cell
+from p_body_randomness.checkpoint import CheckpointStore, parameters_hash
+from p_body_randomness.cluster import TooFewPbodiesException, run_cells
+from p_body_randomness.sampling import SamplingInfeasibleError
+from p_body_randomness.profiling import timer, profile_cell, load_records, write_summary
+from p_body_randomness.file_index import load_file_index, find_cells
+from p_body_randomness.image_store import ImageStore, pack_images
+from p_body_randomness.results import ResultWriter, ParquetResultWriter, require_pyarrow
+
+try:
+    import tomllib
+except ImportError:
+    import tomli as tomllib
+
+__author__ = "Moritz Schaefer"
+__copyright__ = "Moritz Schaefer"
+__license__ = "mit"
+
+_logger = logging.getLogger(__name__)
+
+# Image stores opened by this process, by path
+_image_stores = {}
+
+# Columns that identify the cell of every result row
+CELL_COLUMNS = ['Well', 'SiteX', 'SiteY', 'Label']
+
+# Data settings that change the results of a cell, a checkpoint is only
+# resumed if they are unchanged
+CHECKPOINT_DATA_KEYS = ['crop_to_cell', 'crop_margin', 'image_store']
+
+default_data = {
+    'base_path': cluster.base_path,
+    'filename_template': cluster.TEMPLATE_FILENAME,
+    'wells': cluster.wells,
+    'image_types': cluster.image_types,
+    'subfolders': cluster.subfolders,
+    'crop_to_cell': True,
+    'crop_margin': CROP_MARGIN,
+}
+
+
+def load_config(path):
+    """Read a TOML or YAML configuration file
+
+    Args:
+      path (str): path of the configuration, files ending in .yaml or .yml
+        are read as YAML, all others as TOML
+
+    Returns:
+      dict: the configuration
+    """
+    if path.endswith(('.yaml', '.yml')):
+        try:
+            import yaml
+        except ImportError:
+            raise ImportError('Reading YAML configurations requires PyYAML (pip install PyYAML)')
+        with open(path) as config_file:
+            return yaml.safe_load(config_file) or {}
+
+    with open(path, 'rb') as config_file:
+        return tomllib.load(config_file)
+
+
+def get_settings(config, analysis_names=None):
+    """Combine a configuration with the defaults
+
+    Args:
+      config (dict): configuration as returned by load_config
+      analysis_names ([str]): analyses to run, by default the ones listed in
+        the analyses section of the configuration
+
+    Returns:
+      dict: settings with the keys data, output_path, checkpoint, profile,
+      dataset (None without a dataset), run, analyses (list of names),
+      parameters (dict of analysis name: parameters) and sweep (list of
+      parameter combinations, [{}] without a sweep)
+    """
+    data = dict(default_data)
+    data.update(config.get('data', {}))
+    analyses_config = config.get('analyses', {})
+
+    if analysis_names is None:
+        analysis_names = list(analyses_config)
+    unknown = [name for name in analysis_names if name not in ANALYSES]
+    if unknown:
+        raise ValueError('Unknown analyses ' + ', '.join(unknown) + ', available analyses: ' + ', '.join(ANALYSES))
+
+    # Every analysis only gets the parameters it uses, so that the sweep does
+    # not repeat it for parameters it ignores
+    parameters = {}
+    for name in analysis_names:
+        parameters[name] = dict(ANALYSES[name].parameters)
+        parameters[name].update({key: value for key, value in config.get('parameters', {}).items() if key in parameters[name]})
+        parameters[name].update(analyses_config.get(name) or {})
+
+    sweep = config.get('sweep', {})
+    unknown = [key for key in sweep if not any(key in parameters[name] for name in analysis_names)]
+    if unknown:
+        raise ValueError('The sweep contains parameters that no selected analysis uses: ' + ', '.join(unknown))
+    invalid = [key for key in sweep if not isinstance(sweep[key], list) or not sweep[key]]
+    if invalid:
+        raise ValueError('The values of a sweep parameter have to be a non-empty list, invalid: ' + ', '.join(invalid))
+    combinations = [dict(zip(sweep, values)) for values in product(*sweep.values())]
+
+    output = config.get('output', {})
+    output_path = output.get('path', '.')
+    return {
+        'data': data,
+        'output_path': output_path,
+        'checkpoint': output.get('checkpoint', False),
+        'profile': output.get('profile', False),
+        'dataset': output.get('dataset'),
+        'run': output.get('run', os.path.basename(os.path.abspath(output_path))),
+        'analyses': analysis_names,
+        'parameters': parameters,
+        'sweep': combinations,
+    }
+
+
+def load_cell_images(data, well, site_x, site_y, label, image_types):
+    """Load the single cell images of a cell
+
+    Args:
+      data (dict): data settings (see get_settings)
+      image_types ([str]): image types to load, keys of data['image_types']
+
+    Returns:
+      dict: image type: grayscale image (from an image store, cropped to the
+      cell plus the crop_margin it was packed with, which has to be
+      data['crop_margin'])
+    """
+    if data.get('image_store'):
+        if data['image_store'] not in _image_stores:
+            _image_stores[data['image_store']] = ImageStore(data['image_store'])
+        # A store packed with a smaller margin would be cropped again, which
+        # changes the smoothing near the edges of the crop
+        return _image_stores[data['image_store']].load(well, site_x, site_y, label, image_types, margin = data['crop_margin'])
+
+    images = {}
+    for image_type in image_types:
+        filename = data['filename_template'].format(well = well, x = site_x, y = site_y, image_type = data['image_types'][image_type], label = label)
+        path = os.path.join(data['base_path'], data['subfolders'][image_type], filename)
+        images[image_type] = cv2.imread(path, 0)
+        if images[image_type] is None:
+            raise IOError('Could not read image ' + path)
+    return images
+
+
+def required_image_types(settings):
+    """Image types needed by the selected analyses"""
+    image_types = set()
+    for name in settings['analyses']:
+        image_types.update(ANALYSES[name].image_types)
+    return sorted(image_types)
+
+
+def analysis_runs(settings):
+    """The analyses and parameter combinations to evaluate on every cell
+
+    Every analysis is run once per combination of the sweep, restricted to the
+    parameters the analysis uses (so that e.g. nn_distances is not repeated
+    for every min_sampling_distance).
+
+    Returns:
+      list: (analysis name, combination, parameters) tuples
+    """
+    runs = []
+    for name in settings['analyses']:
+        seen = []
+        for combination in settings['sweep']:
+            combination = {key: value for key, value in combination.items() if key in settings['parameters'][name]}
+            if combination in seen:
+                continue
+            seen.append(combination)
+            parameters = dict(settings['parameters'][name])
+            parameters.update(combination)
+            runs.append((name, combination, parameters))
+    return runs
+
+
+def evaluate_cell(settings, well, site_x, site_y, label, seed=None):
+    """Run all selected analyses (and parameter combinations) on one cell
+
+    Returns:
+      list: one list of result rows per entry of analysis_runs (empty if the
+      cell was skipped)
+    """
+    _logger.info('Evaluating site %s: %s%s, Label %s', well, site_x, site_y, label)
+    with timer('load_images'):
+        images = load_cell_images(settings['data'], well, site_x, site_y, label, required_image_types(settings))
+    if settings['data']['crop_to_cell'] and 'cellmask' in images:
+        # The analyses only report distances, intensities and counts, which
+        # do not depend on the offset of the crop
+        with timer('crop_to_cell'):
+            images, offset = crop_to_cell(images, settings['data']['crop_margin'])
+        _logger.debug('Cropped the images to %s at offset %s', images['cellmask'].shape, offset)
+
+    # Every combination gets the same random stream, so differences between
+    # the combinations are not blurred by simulation noise
+    cache = CellCache(images)
+    results = []
+    for name, combination, parameters in analysis_runs(settings):
+        try:
+            with timer('analysis.' + name):
+                results.append(ANALYSES[name].function(images, parameters, seed, cache))
+        except TooFewPbodiesException:
+            results.append([])
+        except SamplingInfeasibleError as error:
+            _logger.warning('Skipping %s of %s: %s%s, Label %s: %s', name, well, site_x, site_y, label, error)
+            results.append([])
+    return results
+
+
+def profiled_evaluate_cell(settings, well, site_x, site_y, label, seed=None):
+    """Like evaluate_cell, but profiles the cell (see profiling.profile_cell)
+
+    Returns:
+      tuple: (results of evaluate_cell, profiling record of the cell)
+    """
+    with profile_cell(well=well, site_x=int(site_x), site_y=int(site_y), label=str(label)) as record:
+        results = evaluate_cell(settings, well, site_x, site_y, label, seed)
+    return results, record
+
+
+def _evaluated_cells(settings, well, cells, nb_workers, seed):
+    # Yields (site_x, site_y, label, results) of the cells as run_cells, in
+    # the order of cells or, for a checkpointed well, as soon as every cell is
+    # done (the result tables are written from the checkpoint in the order of
+    # the cells). With profiling, the records of the cells are written to
+    # Profile_<well>.jsonl as they come in (appended to the records of earlier
+    # runs of a checkpointed well) and all records in the file are summarized
+    # at the end
+    ordered = not settings['checkpoint']
+    if not settings['profile']:
+        yield from run_cells(partial(evaluate_cell, settings), cells, nb_workers, seed, ordered)
+        return
+
+    path = os.path.join(settings['output_path'], 'Profile_' + well + '.jsonl')
+    with open(path, 'a' if settings['checkpoint'] else 'w') as profile_file:
+        for site_x, site_y, label, (results, record) in run_cells(partial(profiled_evaluate_cell, settings), cells, nb_workers, seed, ordered):
+            profile_file.write(json.dumps(record) + '\n')
+            profile_file.flush()
+            yield site_x, site_y, label, results
+    write_summary(os.path.join(settings['output_path'], 'ProfileSummary_' + well + '.json'), load_records(path))
+
+
+class _ResultTables:
+    # The result CSVs of a well. Without a sweep, every analysis has its own
+    # table. With a sweep, all results are written to one long table with one
+    # row per value: the cell, the analysis, the swept parameters, the index
+    # of the result row and the name and value of the column. With a dataset,
+    # every table is written to its partition of the dataset as well (as the
+    # table named after the analysis, or parameter_sweep).
+
+    def __init__(self, settings, well):
+        os.makedirs(settings['output_path'], exist_ok=True)
+        self.sweep_keys = list(settings['sweep'][0])
+        tables = {}
+        if self.sweep_keys:
+            # Swept parameters with values that are not numbers (e.g.
+            # null_model) are stored as strings in the dataset
+            column_types = {key: 'string' for key in self.sweep_keys if not all(isinstance(combination[key], numbers.Number) for combination in settings['sweep'])}
+            tables[None] = ('parameter_sweep', 'ParameterSweep_', CELL_COLUMNS + ['Analysis'] + self.sweep_keys + ['Row', 'Variable', 'Value'], column_types)
+        else:
+            for name in settings['analyses']:
+                tables[name] = (name, ANALYSES[name].output_prefix, CELL_COLUMNS + result_columns(name, settings['parameters'][name]), {})
+
+        self.writers = {}
+        for key, (table, output_prefix, columns, column_types) in tables.items():
+            self.writers[key] = [ResultWriter(os.path.join(settings['output_path'], output_prefix + well + '.csv'), columns)]
+            if settings['dataset']:
+                self.writers[key].append(ParquetResultWriter(settings['dataset'], table, settings['run'], well, columns, column_types))
+
+    def add_rows(self, cell, name, combination, parameters, rows):
+        if not self.sweep_keys:
+            rows = [list(cell) + list(row) for row in rows]
+            for writer in self.writers[name]:
+                writer.add_rows(rows)
+            return
+        swept = [combination.get(key, '') for key in self.sweep_keys]
+        columns = result_columns(name, parameters)
+        for i, row in enumerate(rows):
+            for column, value in zip(columns, row):
+                for writer in self.writers[None]:
+                    writer.add_row(list(cell) + [name] + swept + [i, column, value])
+
+    def close(self):
+        for writers in self.writers.values():
+            for writer in writers:
+                writer.close()
+
+
+def checkpoint_path(settings, well):
+    """Path of the checkpoint of a well"""
+    return os.path.join(settings['output_path'], 'checkpoints', well + '.sqlite')
+
+
+def run_well(settings, well, file_index, nb_workers=None, seed=None):
+    """Run the selected analyses on all cells of a well and write the results
+
+    If checkpoints are enabled, the results of every cell are committed to the
+    checkpoint of the well as soon as it is evaluated, cells that are already
+    in the checkpoint with the same parameters, seed and cropping (see
+    CHECKPOINT_DATA_KEYS) are not evaluated again.
+
+    Args:
+      settings (dict): settings as returned by get_settings
+      well (str): the well to evaluate
+      file_index (dict): index of the images as returned by load_file_index
+      nb_workers (int): number of worker processes, all cores by default
+      seed (int): seed of the random streams, every cell gets its own stream
+        derived from the seed and (well, site, label), None uses fresh entropy
+    """
+    cells = find_cells(file_index, well, required_image_types(settings))
+    _logger.info('Found %d cells in well %s', len(cells), well)
+    runs = analysis_runs(settings)
+
+    if not settings['checkpoint']:
+        tables = _ResultTables(settings, well)
+        try:
+            for site_x, site_y, label, results in _evaluated_cells(settings, well, cells, nb_workers, seed):
+                for (name, combination, parameters), rows in zip(runs, results):
+                    tables.add_rows((well, site_x, site_y, label), name, combination, parameters, rows)
+        finally:
+            tables.close()
+        return
+
+    path = checkpoint_path(settings, well)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with CheckpointStore(path) as store:
+        data = {key: settings['data'].get(key) for key in CHECKPOINT_DATA_KEYS}
+        hashes = [parameters_hash(parameters, seed, data) for _, _, parameters in runs]
+        completed = set(cells)
+        for (name, _, _), run_hash in zip(runs, hashes):
+            completed &= store.completed_cells(well, name, run_hash)
+        pending = [cell for cell in cells if cell not in completed]
+        if completed:
+            _logger.info('Resuming well %s from %s, %d of %d cells are done', well, path, len(completed), len(cells))
+
+        for site_x, site_y, label, results in _evaluated_cells(settings, well, pending, nb_workers, seed):
+            store.add((well, site_x, site_y, label), [(name, run_hash, rows) for (name, _, _), run_hash, rows in zip(runs, hashes, results)])
+
+        # The result tables are written from the checkpoint once all cells
+        # are done, including the cells of earlier runs
+        tables = _ResultTables(settings, well)
+        try:
+            for (name, combination, parameters), run_hash in zip(runs, hashes):
+                for cell, rows in store.rows(cells, name, run_hash):
+                    tables.add_rows(cell, name, combination, parameters, rows)
+        finally:
+            tables.close()
+
+
+def parse_args(args):
+    """Parse command line parameters
+
+    Args:
+      args ([str]): command line parameters as list of strings
+
+    Returns:
+      :obj:`argparse.Namespace`: command line parameters namespace
+    """
+    parser = argparse.ArgumentParser(
+        description="Monte Carlo simulations of P-body localization")
+    parser.add_argument(
+        '--version',
+        action='version',
+        version='p-body-randomness {ver}'.format(ver=__version__))
+    parser.add_argument(
+        dest="config",
+        help="TOML or YAML configuration file",
+        metavar="CONFIG")
+    parser.add_argument(
+        '--well-index',
+        dest="well_index",
+        help="only evaluate the well with this index in the list of wells "
+             "(e.g. the slurm array task id)",
+        type=int)
+    parser.add_argument(
+        '--well',
+        dest="wells",
+        help="only evaluate these wells",
+        nargs='+')
+    parser.add_argument(
+        '--analyses',
+        dest="analyses",
+        help="analyses to run instead of the ones in the configuration, "
+             "available: " + ", ".join(ANALYSES),
+        nargs='+')
+    parser.add_argument(
+        '--pack-images',
+        dest="pack_images",
+        help="convert the images of the wells into the image_store of the "
+             "configuration instead of running the analyses",
+        action='store_true')
+    parser.add_argument(
+        '-j',
+        '--workers',
+        dest="workers",
+        help="number of worker processes, defaults to all available cores",
+        type=int)
+    parser.add_argument(
+        '--seed',
+        dest="seed",
+        help="seed for reproducible simulations",
+        type=int)
+    parser.add_argument(
+        '--profile',
+        dest="profile",
+        help="write the time per stage, sampler counters and peak memory of "
+             "every cell next to the results",
+        action='store_true')
+    parser.add_argument(
+        '-v',
+        '--verbose',
+        dest="loglevel",
+        help="set loglevel to INFO",
+        action='store_const',
+        const=logging.INFO)
+    parser.add_argument(
+        '-vv',
+        '--very-verbose',
+        dest="loglevel",
+        help="set loglevel to DEBUG",
+        action='store_const',
+        const=logging.DEBUG)
+    return parser.parse_args(args)
+
+
+def setup_logging(loglevel):
+    """Setup basic logging
+
+    Args:
+      loglevel (int): minimum loglevel for emitting messages
+    """
+    logformat = "[%(asctime)s] %(levelname)s:%(name)s:%(message)s"
+    logging.basicConfig(level=loglevel, stream=sys.stdout,
+                        format=logformat, datefmt="%Y-%m-%d %H:%M:%S")
+
+
+def main(args):
+    """Main entry point allowing external calls
+
+    Args:
+      args ([str]): command line parameter list
+    """
+    args = parse_args(args)
+    setup_logging(args.loglevel)
+    settings = get_settings(load_config(args.config), args.analyses)
+    if args.profile:
+        settings['profile'] = True
+    if settings['dataset']:
+        # Fail before the first cell is evaluated, not when the results are written
+        require_pyarrow()
+    if not settings['analyses'] and not args.pack_images:
+        raise ValueError('No analysis selected, available analyses: ' + ', '.join(ANALYSES))
+
+    if args.well_index is not None:
+        wells = [settings['data']['wells'][args.well_index]]
+    elif args.wells:
+        wells = args.wells
+    else:
+        wells = settings['data']['wells']
+
+    # The image folders are only listed once, no matter how many wells
+    file_index = load_file_index(settings['data'], settings['data'].get('file_index'))
+    if args.pack_images:
+        if not settings['data'].get('image_store'):
+            raise ValueError('The configuration does not define an image_store in data')
+        image_types = list(settings['data']['image_types'])
+        for well in wells:
+            _logger.info("Packing the images of well %s", well)
+            cells = find_cells(file_index, well, image_types)
+            pack_images(settings['data']['image_store'], cells, file_index, image_types, settings['data']['crop_margin'])
+        return
+
+    for well in wells:
+        _logger.info("Evaluating well %s", well)
+        run_well(settings, well, file_index, nb_workers=args.workers, seed=args.seed)
+
+
+def run():
+    """Entry point for console_scripts
+    """
+    main(sys.argv[1:])
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Opt-in profiling of the evaluation of cells.
+
+The stages of an analysis (loading the images, masks, smoothing, sampling,
+nearest neighbor distances, ...) are wrapped in timer(name), and the sampler
+counts its candidates and rejections with count(name, value). Both do nothing
+unless a cell is evaluated inside profile_cell(), which collects the time and
+number of calls per stage, the counters and the peak memory of the cell into
+one record. The pipeline writes these records as JSON lines next to the
+result tables (see write_summary for the summary across a well).
+
+Stages can be nested (e.g. sampling inside an analysis), the time of a stage
+includes the time of the stages inside it.
+"""
+import json
+import logging
+import resource
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+import numpy as np
+
+_logger = logging.getLogger(__name__)
+
+# The record of the cell that is currently profiled in this process, None if
+# profiling is off
+_record = None
+
+
+class timer:
+    '''
+    Adds the time spent inside it to the stage name of the current record.
+    Use it as a context manager (with timer('smoothing'): ...) or as a
+    decorator of a function (@timer('smoothing')).
+    '''
+
+    def __init__(self, name):
+        self.name = name
+        self._starts = []
+
+    def __enter__(self):
+        if _record is not None:
+            self._starts.append(time.perf_counter())
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if _record is not None and self._starts:
+            elapsed = time.perf_counter() - self._starts.pop()
+            stage = _record['stages'].setdefault(self.name, {'seconds': 0.0, 'calls': 0})
+            stage['seconds'] += elapsed
+            stage['calls'] += 1
+
+    def __call__(self, function):
+        @wraps(function)
+        def timed(*args, **kwargs):
+            with self:
+                return function(*args, **kwargs)
+        return timed
+
+
+def count(name, value = 1):
+    '''
+    Adds value to the counter name of the current record
+    '''
+    if _record is not None:
+        _record['counters'][name] = _record['counters'].get(name, 0) + value
+
+
+def _peak_memory_mb(reset = False):
+    # Linux keeps the peak resident memory of a process in VmHWM, writing 5 to
+    # clear_refs resets it so that every cell gets its own peak. Elsewhere,
+    # only the peak of the whole process is known.
+    try:
+        if reset:
+            with open('/proc/self/clear_refs', 'w') as clear_refs:
+                clear_refs.write('5')
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+@contextmanager
+def profile_cell(**keys):
+    '''
+    Profiles everything inside it (in this process) and yields the record,
+    a dict with the keys (e.g. the well, site and label of the cell),
+    seconds, peak_memory_mb, stages (name: {seconds, calls}) and counters.
+    The record is complete when the block is left.
+    '''
+    global _record
+    previous = _record
+    record = dict(keys)
+    record.update({'seconds': 0.0, 'peak_memory_mb': 0.0, 'stages': {}, 'counters': {}})
+    _record = record
+    _peak_memory_mb(reset = True)
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record['seconds'] = time.perf_counter() - start
+        record['peak_memory_mb'] = _peak_memory_mb()
+        _record = previous
+
+
+def summarize(records):
+    '''
+    Summarizes the records of many cells.
+
+    Returns a dict with the number of cells, their total seconds, the median
+    and maximal seconds and peak memory per cell, per stage the total seconds,
+    calls, fraction of the total time and median seconds per cell, and the
+    sums of the counters
+    '''
+    seconds = np.array([record['seconds'] for record in records])
+    memory = np.array([record['peak_memory_mb'] for record in records])
+    total = float(seconds.sum())
+    summary = {
+        'cells': len(records),
+        'seconds': total,
+        'median_seconds_per_cell': float(np.median(seconds)) if len(records) else 0.0,
+        'max_seconds_per_cell': float(seconds.max()) if len(records) else 0.0,
+        'median_peak_memory_mb': float(np.median(memory)) if len(records) else 0.0,
+        'max_peak_memory_mb': float(memory.max()) if len(records) else 0.0,
+        'stages': {},
+        'counters': {},
+    }
+    stage_names = sorted({name for record in records for name in record['stages']})
+    for name in stage_names:
+        per_cell = [record['stages'].get(name, {'seconds': 0.0, 'calls': 0}) for record in records]
+        stage_seconds = float(sum(stage['seconds'] for stage in per_cell))
+        summary['stages'][name] = {
+            'seconds': stage_seconds,
+            'calls': sum(stage['calls'] for stage in per_cell),
+            'fraction': stage_seconds / total if total > 0 else 0.0,
+            'median_seconds_per_cell': float(np.median([stage['seconds'] for stage in per_cell])),
+        }
+    for record in records:
+        for name, value in record['counters'].items():
+            summary['counters'][name] = summary['counters'].get(name, 0) + value
+    return summary
+
+
+def load_records(path, keys = ('well', 'site_x', 'site_y', 'label')):
+    '''
+    Reads the records of a JSON lines file. A cell that was profiled more
+    than once (e.g. a job was killed after its record was written, but before
+    its results were checkpointed) only keeps its last record, and a last
+    line that was cut off when a job was killed is skipped.
+    '''
+    records = {}
+    with open(path) as records_file:
+        for line in records_file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                _logger.warning('Skipping an incomplete profiling record in %s', path)
+                continue
+            records[tuple(record.get(key) for key in keys)] = record
+    return list(records.values())
+
+
+def write_summary(path, records):
+    '''
+    Writes the summary of records (see summarize) as JSON to path, logs the
+    stages by their total time and returns the summary
+    '''
+    summary = summarize(records)
+    with open(path, 'w') as summary_file:
+        json.dump(summary, summary_file, indent=2)
+
+    _logger.info('Profiled %d cells in %.1f s (median %.3f s, peak memory up to %.0f MB per cell)',
+                 summary['cells'], summary['seconds'], summary['median_seconds_per_cell'], summary['max_peak_memory_mb'])
+    for name, stage in sorted(summary['stages'].items(), key=lambda item: -item[1]['seconds']):
+        _logger.info('  %-40s %9.2f s %6.1f %% %8d calls', name, stage['seconds'], 100 * stage['fraction'], stage['calls'])
+    for name, value in sorted(summary['counters'].items()):
+        _logger.info('  %-40s %d', name, value)
+    return summary
@@ -2,44 +2,162 @@
 Calculate what the average protein signals are.
 '''
 
+from functools import lru_cache
+from math import pi
+
 import cv2
 import numpy as np
 
+from p_body_randomness.cell_masks import CellMasks
+from p_body_randomness.centroids import generate_centroids_mask
 from p_body_randomness.smooth_image import smooth_protein_image
+from p_body_randomness.profiling import timer
+
 
-def calculate_mean_intensities(protein_signal, pbody_mask, cell_mask, nucleus_image):
+@lru_cache(maxsize=None)
+def annulus_stencil(radius):
     '''
-    Function: Calculates average signal intensity in the cytoplasm and in areas surrounding p-bodies.
-    Input:    Image files containing protein signal, p-body locations, cell segmentation, DAPI signal.
-    Output:   Tuple, first float is average intensity in the cytoplasm, second float is average intensity around p-bodies.
+    Function: Pixel offsets of the disc that generate_centroids_mask draws for a p-body of this radius and of the
+              region that ProteinContext.surroundings dilates it to (opened with a 3x3 and dilated with a 10x10
+              kernel). The offsets are relative to the centroid.
+    Input:    Radius of the disc in pixels.
+    Output:   Tuple of two (pixels, 2) arrays of (dy, dx) offsets, the dilated region and the disc.
     '''
-    # Creating mask for the nucleus
-    nucleus_smoothed = cv2.GaussianBlur(nucleus_image, (5,5), 0)
-    nucleus_mask = nucleus_smoothed > 10
+    # The image is large enough that the border does not touch the dilated disc
+    center = radius + 8
+    disc = np.zeros((2 * center + 1, 2 * center + 1), np.uint8)
+    cv2.circle(disc, (center, center), radius, (255, 0, 0), -1)
+
+    no_small_p_bodies = cv2.morphologyEx(disc, cv2.MORPH_OPEN, np.ones((3, 3), np.uint8))
+    dilated = cv2.dilate(no_small_p_bodies, np.ones((10, 10), np.uint8))
+
+    dilated_offsets = np.argwhere(dilated > 0) - center
+    disc_offsets = np.argwhere(disc > 0) - center
+    dilated_offsets.flags.writeable = False
+    disc_offsets.flags.writeable = False
+    return dilated_offsets, disc_offsets
+
 
-    # Removing small p-bodies from the image.
-    small_p_body_kernel = np.ones((3, 3), np.uint8)
-    no_small_p_bodies = cv2.morphologyEx(pbody_mask, cv2.MORPH_OPEN, small_p_body_kernel)
+def _disc_radii(pbodies):
+    # Radii of the discs that generate_centroids_mask draws
+    return (np.sqrt(pbodies[:, 2] / pi)).astype(np.int64)
 
-    # Dilating remaining p-bodies.
-    dilation_kernel = np.ones((10, 10), np.uint8)
-    dilated_pbodies = cv2.dilate(no_small_p_bodies, dilation_kernel)
 
-    # Removing resulting areas that are not in the cytoplasm.
-    dilated_pbodies[(cell_mask == 0) | (nucleus_mask != 0)] = 0
+def _discs_may_touch(pbodies):
+    # The 3x3 opening in ProteinContext.surroundings keeps the same pixels of
+    # the union of the discs as of every disc alone, unless two discs overlap
+    # or have 4-neighboring pixels: a 3x3 square covered by two discs that do
+    # not touch is covered by one of them. The pixels of a disc are at most
+    # its radius away from the centroid.
+    radii = _disc_radii(pbodies)
+    centroids = pbodies[:, :2].astype(np.int64)
+    squared_distances = np.sum((centroids[:, np.newaxis] - centroids[np.newaxis]) ** 2, axis=-1)
+    touching = squared_distances <= (radii[:, np.newaxis] + radii[np.newaxis] + 1) ** 2
+    np.fill_diagonal(touching, False)
+    return bool(np.any(touching))
+
+
+def _stencil_pixels(pbodies, shape, stencil_index):
+    # Flat indices of the union of the stencils of all p-bodies, the p-bodies
+    # with the same radius are handled together
+    radii = _disc_radii(pbodies)
+    pixels = [np.zeros(0, dtype=np.int64)]
+    for radius in np.unique(radii):
+        offsets = annulus_stencil(int(radius))[stencil_index]
+        centroids = pbodies[radii == radius, :2].astype(np.int64)
+        rows = (centroids[:, 1, None] + offsets[None, :, 0]).ravel()
+        columns = (centroids[:, 0, None] + offsets[None, :, 1]).ravel()
+        inside = (rows >= 0) & (rows < shape[0]) & (columns >= 0) & (columns < shape[1])
+        pixels.append(rows[inside] * shape[1] + columns[inside])
+    # Sorting and dropping repeats is much faster than np.unique for these
+    # small arrays
+    pixels = np.sort(np.concatenate(pixels))
+    return np.concatenate((pixels[:1], pixels[1:][pixels[1:] != pixels[:-1]]))
+
+
+class ProteinContext:
+    '''
+    Function: Precomputes everything about the protein signal of a cell that does not depend on the P-body mask
+              being measured (smoothed protein image, cytoplasm mask and its mean intensity), so that the intensity
+              around many (e.g. simulated) P-body masks can be measured cheaply.
+    Input:    Image files containing protein signal, p-body locations, cell segmentation, DAPI signal,
+              optionally the CellMasks of the cell to reuse its nucleus mask.
+              The protein image is smoothed after damping the signal of the P-bodies in pbody_mask.
+    '''
 
-    # Determining which pixels are in p-body surroundings.
-    p_body_surroundings = dilated_pbodies - pbody_mask > 0
+    @timer('protein_context')
+    def __init__(self, protein_signal, pbody_mask, cell_mask, nucleus_image, masks = None):
+        if masks is None:
+            masks = CellMasks(cell_mask, nucleus_image)
+        self.masks = masks
+        self.cell_mask = cell_mask
 
-    # Processing the image to make the protein signal smoother.
-    proteins_smooth = smooth_protein_image(protein_signal, pbody_mask, cell_mask, nucleus_image)
+        # Processing the image to make the protein signal smoother.
+        self.proteins_smooth = smooth_protein_image(protein_signal, pbody_mask, cell_mask, nucleus_image, masks = masks)
 
-    # Calculating average signal in the p-body surroundings.
-    surroundings_signal = proteins_smooth[p_body_surroundings]
-    surr_mean = np.mean(surroundings_signal)
+        # Calculating average signal in the cytoplasm.
+        self.cytoplasm_mask = (cell_mask != 0) & ~masks.nucleus
+        self.cytoplasm_mean = np.mean(self.proteins_smooth[self.cytoplasm_mask], dtype=np.float64)
 
-    # Calculating average signal in the cytoplasm.
-    cytoplasm_signal = proteins_smooth[(cell_mask != 0) & (nucleus_mask == 0)]
-    cyto_mean = np.mean(cytoplasm_signal)
+    def surroundings(self, pbody_mask):
+        '''
+        Function: Determines which pixels are in the surroundings of the p-bodies.
+        Input:    P-body mask (uint8 numpy array).
+        Output:   Boolean mask of the p-body surroundings.
+        '''
+        # Removing small p-bodies from the image.
+        small_p_body_kernel = np.ones((3, 3), np.uint8)
+        no_small_p_bodies = cv2.morphologyEx(pbody_mask, cv2.MORPH_OPEN, small_p_body_kernel)
 
-    return (cyto_mean, surr_mean)
+        # Dilating remaining p-bodies.
+        dilation_kernel = np.ones((10, 10), np.uint8)
+        dilated_pbodies = cv2.dilate(no_small_p_bodies, dilation_kernel)
+
+        # Removing resulting areas that are not in the cytoplasm.
+        dilated_pbodies[~self.cytoplasm_mask] = 0
+
+        # Determining which pixels are in p-body surroundings.
+        return dilated_pbodies - pbody_mask > 0
+
+    def surround_mean(self, pbody_mask):
+        '''
+        Function: Calculates the average signal intensity in the areas surrounding the p-bodies of pbody_mask.
+        Output:   Float, average intensity around the p-bodies.
+        '''
+        return np.mean(self.proteins_smooth[self.surroundings(pbody_mask)], dtype=np.float64)
+
+    def surround_mean_at(self, pbodies):
+        '''
+        Function: Calculates the average signal intensity around p-bodies given as centroids, without drawing them
+                  into a mask. The surroundings are the union of the precomputed stencils of the p-bodies. This
+                  equals surround_mean(generate_centroids_mask(pbodies)) unless the discs of two p-bodies touch,
+                  which happens for large p-bodies (e.g. often for an area of 100 with a min_distance of 6). Those
+                  p-bodies are drawn into a mask and measured with surround_mean instead.
+        Input:    List of (x, y, area) of the p-bodies (e.g. from sampling.sample_pbodies).
+        Output:   Float, average intensity around the p-bodies.
+        '''
+        shape = self.proteins_smooth.shape
+        pbodies = np.asarray(pbodies, dtype=np.float64).reshape(-1, 3)
+        if _discs_may_touch(pbodies):
+            pbody_mask = generate_centroids_mask([(int(x), int(y), area) for x, y, area in pbodies.tolist()], shape)
+            return self.surround_mean(pbody_mask)
+
+        dilated = _stencil_pixels(pbodies, shape, 0)
+        discs = _stencil_pixels(pbodies, shape, 1)
+
+        # Same as dilated - pbody_mask > 0 on the uint8 masks in surroundings:
+        # the dilated cytoplasm without the discs, plus the discs outside of it
+        dilated = dilated[self.cytoplasm_mask.ravel()[dilated]]
+        surroundings = np.setxor1d(dilated, discs, assume_unique=True)
+        return np.mean(self.proteins_smooth.ravel()[surroundings], dtype=np.float64)
+
+
+def calculate_mean_intensities(protein_signal, pbody_mask, cell_mask, nucleus_image, masks = None):
+    '''
+    Function: Calculates average signal intensity in the cytoplasm and in areas surrounding p-bodies.
+    Input:    Image files containing protein signal, p-body locations, cell segmentation, DAPI signal,
+              optionally the CellMasks of the cell to reuse its nucleus mask.
+    Output:   Tuple, first float is average intensity in the cytoplasm, second float is average intensity around p-bodies.
+    '''
+    context = ProteinContext(protein_signal, pbody_mask, cell_mask, nucleus_image, masks = masks)
+    return (context.cytoplasm_mean, context.surround_mean(pbody_mask))
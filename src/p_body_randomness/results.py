@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Writes the result tables of the cluster scripts and reads them back.
+
+Besides the CSV of every well, the results can be written to a Parquet
+dataset shared by all runs of a plate, with one folder per table (analysis)
+that is partitioned by run and well:
+
+    dataset/nn_area_sampling/Run=run7/Well=C03/part-0.parquet
+
+The columns are stored compactly (sites as int16, labels and counts as
+int32, other results as float32) and load_results only reads the columns, runs and wells it is
+asked for. Writing and reading the dataset requires pyarrow (pip install
+pyarrow).
+"""
+import os
+
+import pandas as pd
+
+
+class ResultWriter:
+    '''
+    Streams result rows to a CSV file.
+
+    Rows are buffered and appended to the file in batches, so the cost of
+    writing is linear in the number of rows and the memory only holds one
+    batch, no matter how many cells a well has.
+
+    Args:
+        path: Path of the CSV file, it is overwritten
+        columns: List of the column names, every row has one value per column
+        batch_size: Number of rows that are buffered before they are written
+    '''
+
+    def __init__(self, path, columns, batch_size = 1000):
+        self.columns = list(columns)
+        self.batch_size = batch_size
+        self._rows = []
+        self._file = open(path, 'w', newline='')
+        pd.DataFrame(columns=self.columns).to_csv(self._file, index=False)
+
+    def add_row(self, row):
+        if len(row) != len(self.columns):
+            raise ValueError('Expected ' + str(len(self.columns)) + ' values per row, got ' + str(len(row)))
+        self._rows.append(list(row))
+        if len(self._rows) >= self.batch_size:
+            self.flush()
+
+    def add_rows(self, rows):
+        for row in rows:
+            self.add_row(row)
+
+    def flush(self):
+        if self._rows:
+            batch = pd.DataFrame(self._rows, columns=self.columns)
+            batch.to_csv(self._file, header=False, na_rep='NaN', index=False)
+            self._rows = []
+        self._file.flush()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+# Compact types of the columns of the dataset, other columns are stored as
+# float32 unless their type is given to ParquetResultWriter
+COLUMN_TYPES = {
+    'SiteX': 'int16',
+    'SiteY': 'int16',
+    'Label': 'int32',
+    'Analysis': 'string',
+    'Row': 'int32',
+    'Variable': 'string',
+    'Number_of_pbodies': 'int32',
+    'Number_of_pbodies_in_Nucleus': 'int32',
+    'Number_of_pbodies_cytoplasm': 'int32',
+    'Number_of_pbodies_unshrunken_cytoplasm': 'int32',
+    'Number_of_pbodies_unshrunken_Nucleus': 'int32',
+    'Area_of_Cytoplasm': 'int32',
+    'Number_of_simulation_rounds': 'int32',
+}
+
+
+def require_pyarrow():
+    '''
+    Returns the pyarrow module, raises an ImportError if it is not installed
+    '''
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        import pyarrow.dataset
+    except ImportError:
+        raise ImportError('The Parquet results dataset requires pyarrow (pip install pyarrow)')
+    return pyarrow
+
+
+def partition_path(dataset_path, table, run, well):
+    '''
+    Returns the folder of the results of a well of a run in the dataset
+    '''
+    return os.path.join(dataset_path, table, 'Run=' + str(run), 'Well=' + str(well))
+
+
+class ParquetResultWriter:
+    '''
+    Streams the result rows of one well of a run to its partition of a Parquet
+    dataset, replacing earlier results of the same run and well.
+
+    The schema is fixed by the declared columns: the type of a column is
+    taken from column_types, then from COLUMN_TYPES, and is float32 for all
+    other columns (empty strings and None become nulls). The file of the
+    partition is replaced as soon as the writer is opened, so a well without
+    rows leaves an empty file instead of the results of an earlier run. The
+    Run and Well columns are not stored in the files, they are the keys of
+    the partition.
+
+    Args:
+        dataset_path: Folder of the dataset
+        table: Name of the table, e.g. the name of the analysis
+        run: Name of the run
+        well: Well of the rows
+        columns: List of the column names, every row has one value per column
+        column_types: Dict column: pyarrow type name (e.g. 'string') for
+            columns that are neither float32 nor in COLUMN_TYPES
+        batch_size: Number of rows that are buffered before they are written
+    '''
+
+    def __init__(self, dataset_path, table, run, well, columns, column_types = None, batch_size = 1000):
+        pa = self._pyarrow = require_pyarrow()
+        self.columns = list(columns)
+        self.batch_size = batch_size
+        self.path = os.path.join(partition_path(dataset_path, table, run, well), 'part-0.parquet')
+        self._stored = [i for i, column in enumerate(self.columns) if column not in ('Run', 'Well')]
+        types = dict(COLUMN_TYPES)
+        types.update(column_types or {})
+        self._schema = pa.schema([(self.columns[i], getattr(pa, types.get(self.columns[i], 'float32'))()) for i in self._stored])
+        self._rows = []
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._writer = pa.parquet.ParquetWriter(self.path, self._schema, compression='zstd')
+
+    def add_row(self, row):
+        if len(row) != len(self.columns):
+            raise ValueError('Expected ' + str(len(self.columns)) + ' values per row, got ' + str(len(row)))
+        self._rows.append(list(row))
+        if len(self._rows) >= self.batch_size:
+            self.flush()
+
+    def add_rows(self, rows):
+        for row in rows:
+            self.add_row(row)
+
+    def flush(self):
+        if not self._rows:
+            return
+        pa = self._pyarrow
+        arrays = []
+        for i, field in zip(self._stored, self._schema):
+            values = [row[i] for row in self._rows]
+            if pa.types.is_string(field.type):
+                values = [None if value is None else str(value) for value in values]
+            elif pa.types.is_integer(field.type):
+                values = [None if value is None or value == '' else int(value) for value in values]
+            else:
+                values = [None if value is None or value == '' else float(value) for value in values]
+            arrays.append(pa.array(values, type=field.type))
+        self._writer.write_table(pa.Table.from_arrays(arrays, schema=self._schema))
+        self._rows = []
+
+    def close(self):
+        self.flush()
+        self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def csv_to_dataset(csv_path, dataset_path, table, run):
+    '''
+    Adds the results of an earlier run in a CSV (with a Well column, e.g. a
+    per-well result CSV) to the dataset as table and run
+    '''
+    results = pd.read_csv(csv_path)
+    column_types = {column: 'string' for column in results.columns if not pd.api.types.is_numeric_dtype(results[column])}
+    for well, rows in results.groupby('Well', sort=False):
+        with ParquetResultWriter(dataset_path, table, run, well, rows.columns, column_types) as writer:
+            writer.add_rows(rows.itertuples(index=False))
+
+
+def open_results(dataset_path, table):
+    '''
+    Returns the results of table (e.g. 'nn_area_sampling') of all runs and
+    wells as a pyarrow Dataset, which reads nothing until it is scanned. Run
+    and Well are dictionary columns.
+    '''
+    pa = require_pyarrow()
+    partitioning = pa.dataset.partitioning(flavor='hive', dictionaries='infer')
+    return pa.dataset.dataset(os.path.join(dataset_path, table), format='parquet', partitioning=partitioning)
+
+
+def load_results(dataset_path, table, columns = None, runs = None, wells = None, filters = None):
+    '''
+    Loads results from the dataset into a pandas DataFrame. Only the
+    requested columns and the row groups and partitions that can match the
+    filters are read.
+
+    Args:
+        dataset_path: Folder of the dataset
+        table: Name of the table, e.g. 'nn_area_sampling'
+        columns: List of the columns to load, all by default. Run and Well
+            have to be listed to be loaded.
+        runs: List of the runs to load, all by default
+        wells: List of the wells to load, all by default
+        filters: Additional filters as a pyarrow expression or as a list of
+            (column, operator, value) tuples that all have to hold, e.g.
+            [('Number_of_pbodies', '>=', 5)]
+
+    Returns a DataFrame, Run, Well and the string columns are categorical
+    '''
+    pa = require_pyarrow()
+    conditions = []
+    if runs is not None:
+        conditions.append(pa.dataset.field('Run').isin([str(run) for run in runs]))
+    if wells is not None:
+        conditions.append(pa.dataset.field('Well').isin([str(well) for well in wells]))
+    if filters is not None:
+        if isinstance(filters, pa.dataset.Expression):
+            conditions.append(filters)
+        else:
+            conditions.append(pa.parquet.filters_to_expression([list(filters)]))
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+
+    dataset = open_results(dataset_path, table)
+    return dataset.to_table(columns=columns, filter=expression).to_pandas(strings_to_categorical=True)
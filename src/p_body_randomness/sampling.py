@@ -1,66 +1,228 @@
 import numpy as np
-from scipy.stats import rv_discrete
-from p_body_randomness.metrics import nearest_neighbor_distance
 
+from p_body_randomness.profiling import timer, count
 
-def sample_pbodies(sampling_map, n, area_fn=None, min_distance = 6):
+
+class SamplingInfeasibleError(ValueError):
+    '''
+    Raised if n P-bodies could not be placed into a sampling area with the
+    required min_distance between each other
+    '''
+    pass
+
+
+class SamplingTable:
     '''
+    Precomputed cumulative probability table of a sampling map.
+
+    Building the table is the expensive part of sampling, so it should be
+    created once per cell and reused for all simulation rounds. Drawing
+    positions from it is a single vectorized lookup.
+
     Args:
-        cytoplasmic_mask: Either a binary numpy mask representing the sample
+        sampling_map: Either a binary numpy mask representing the sample
             area or a intensity map representing sampling probabilities
+    '''
+
+    @timer('sampling_table')
+    def __init__(self, sampling_map):
+        self.shape = sampling_map.shape
+        cumulative = np.cumsum(sampling_map, dtype=np.float64)
+        if cumulative[-1] <= 0:
+            raise ValueError('The sampling map does not contain any area to sample from')
+        self.cdf = cumulative / cumulative[-1]
+
+    def draw(self, size, rng=None):
+        '''
+        Draws size positions with probabilities proportional to the sampling map.
+        rng: A numpy.random.Generator, or None to use the global numpy random state
+
+        Returns a tuple of two integer numpy arrays (x, y)
+        '''
+        if rng is None:
+            uniform = np.random.random_sample(size)
+        else:
+            uniform = rng.random(size)
+        flat_indices = np.searchsorted(self.cdf, uniform, side='right')
+        y, x = np.unravel_index(flat_indices, self.shape)
+        return x, y
+
+
+def sample_pbodies(sampling_map, n, area_fn=None, min_distance = 6, rng = None):
+    '''
+    Args:
+        sampling_map: Either a binary numpy mask representing the sample
+            area, a intensity map representing sampling probabilities or a
+            SamplingTable precomputed from one of those
         n: The number of pbodies to sample
         area_fn: A function to sample the p body area from or None
         min_distance: Int. Minimal distance that a newly sampled P-body has to
         all existing P-bodies. If it's sampled closer to an existing P-body,
         the sampling is redone (becase P-bodies can't biologically overlap,
         they would have fused and be treated as 1 P-body)
+        rng: A numpy.random.Generator, or None to use the global numpy random state
 
     Returns a list of n sampled positions
+    Raises a SamplingInfeasibleError if the n P-bodies could not be placed
+    into the sampling area with min_distance between them
     '''
+    if isinstance(sampling_map, SamplingTable):
+        sampling_table = sampling_map
+    else:
+        sampling_table = SamplingTable(sampling_map)
 
-    samples = []
-    marginal_x = _calculate_marginal_probability(sampling_map)
-    while len(samples) < n:
-        x = marginal_x.rvs(size=1)[0]
-        y = _sample_y_for_x(sampling_map, x)
+    positions = sample_positions(sampling_table, n, min_distance, rng)
 
+    samples = []
+    for x, y in positions.tolist():
         try:
             area = area_fn()
         except TypeError:
             area = 0
-
-        # Check distance to existing P-pbodies
-        if len(samples) > 0:
-            try:
-                # Calculate the nearest neighbor distance of the new point to all other existing P-pbodies
-                min_distance_measured = min(nearest_neighbor_distance(samples + [(x, y, area)]))
-                if min_distance_measured > min_distance:
-                    samples.append((x, y, area))
-                # when only 2 P-bodies are present and it samples the same location,
-                # the nearest neighbor function throws a ValueError
-            except ValueError:
-                pass
-        else:
-            samples.append((x, y, area))
+        samples.append((x, y, area))
 
     return samples
 
 
-def _sample_y_for_x(sampling_map, x):
-    prob_y = rv_discrete(name='prob_y', values=(
-        np.arange(sampling_map.shape[0]),
-        sampling_map[:, x] / sampling_map[:, x].sum())
-    )
+def sample_positions(sampling_table, n, min_distance=6, rng=None, max_rejections=None, max_restarts=10):
+    '''
+    Samples n positions from a SamplingTable that are all further than
+    min_distance apart from each other (see sample_pbodies).
+    rng: A numpy.random.Generator, or None to use the global numpy random state
+    max_rejections: Number of candidates too close to an accepted position
+        after which the remaining positions are sampled from the residual map
+        (see _sample_from_residual_map), by default 10 * n + 100
+    max_restarts: Number of times the positions are sampled again from the
+        residual map if it runs out of pixels before all n are placed
 
-    return prob_y.rvs(size=1)[0]
+    Returns an integer numpy array of shape (n, 2) with the (x, y) positions
+    Raises a SamplingInfeasibleError if the positions could not be placed
+    into the sampling area within max_restarts restarts
+    '''
+    if max_rejections is None:
+        max_rejections = 10 * n + 100
+    positions = np.zeros((n, 2), dtype=np.int64)
+    nb_accepted = 0
+    nb_rejected = 0
+    occupancy_grid = _OccupancyGrid(min_distance)
+    # Candidates are drawn in batches, a new batch is only needed if too many
+    # candidates were rejected because of the min_distance
+    batch_size = max(2 * n, 64)
+    while nb_accepted < n:
+        candidates_x, candidates_y = sampling_table.draw(batch_size, rng)
+        for x, y in zip(candidates_x.tolist(), candidates_y.tolist()):
+            if nb_accepted >= n:
+                break
+            if nb_rejected > max_rejections:
+                # The sampling area is crowded, rejection sampling could take
+                # very long or never finish
+                _count_draws(nb_accepted + nb_rejected, nb_rejected, fallback = True)
+                return _sample_from_residual_map(sampling_table, positions, nb_accepted, min_distance, rng, max_restarts)
+
+            # Check distance to the existing P-bodies close to the candidate
+            if occupancy_grid.is_free(x, y):
+                occupancy_grid.add(x, y)
+                positions[nb_accepted] = (x, y)
+                nb_accepted += 1
+            else:
+                nb_rejected += 1
+
+    _count_draws(nb_accepted + nb_rejected, nb_rejected)
+    return positions
+
+
+def _count_draws(nb_candidates, nb_rejected, fallback = False):
+    # Sampler counters of the profiling (see profiling.count)
+    count('sampler_calls')
+    count('sampler_candidates', nb_candidates)
+    count('sampler_rejections', nb_rejected)
+    if fallback:
+        count('sampler_residual_map_fallbacks')
+
+
+def _sample_from_residual_map(sampling_table, positions, nb_accepted, min_distance, rng, max_restarts):
+    '''
+    Samples the remaining positions (from nb_accepted on) one by one from the
+    sampling map without the pixels within min_distance of the accepted
+    positions (random sequential adsorption). This gives the same distribution
+    as rejection sampling, but every draw is accepted.
+
+    The positions placed first can leave no pixel for the last ones even if
+    all n positions would fit (a jammed placement). In that case, all
+    positions are sampled again from the full sampling map, up to max_restarts
+    times before a SamplingInfeasibleError is raised.
+    '''
+    sampling_map = np.diff(sampling_table.cdf, prepend=0.0).reshape(sampling_table.shape)
+    radius = int(np.floor(max(min_distance, 0)))
+    offsets_y, offsets_x = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+    disc = offsets_x ** 2 + offsets_y ** 2 <= max(min_distance, 0) ** 2
+
+    def exclude(residual, x, y):
+        y_start, x_start = max(y - radius, 0), max(x - radius, 0)
+        y_stop, x_stop = min(y + radius + 1, residual.shape[0]), min(x + radius + 1, residual.shape[1])
+        window_disc = disc[y_start - y + radius:y_stop - y + radius, x_start - x + radius:x_stop - x + radius]
+        residual[y_start:y_stop, x_start:x_stop][window_disc] = 0
+
+    n = len(positions)
+    for restart in range(max_restarts + 1):
+        if restart > 0:
+            count('sampler_residual_map_restarts')
+            nb_accepted = 0
+        residual = sampling_map.copy()
+        for x, y in positions[:nb_accepted].tolist():
+            exclude(residual, x, y)
+
+        nb_placed = _place_on_residual_map(residual, positions, nb_accepted, exclude, rng)
+        if nb_placed == n:
+            return positions
+
+    raise SamplingInfeasibleError(
+        'Could not place ' + str(nb_placed) + ' of ' + str(n) + ' P-bodies into the sampling area with a min_distance of '
+        + str(min_distance) + ', attempts: ' + str(max_restarts + 1))
+
+
+def _place_on_residual_map(residual, positions, nb_accepted, exclude, rng):
+    # Places the positions from nb_accepted on, returns the number of
+    # positions placed before no pixel was left
+    for i in range(nb_accepted, len(positions)):
+        cumulative = np.cumsum(residual, dtype=np.float64).ravel()
+        if cumulative[-1] <= 0:
+            return i
+        uniform = np.random.random_sample() if rng is None else rng.random()
+        flat_index = min(np.searchsorted(cumulative, uniform * cumulative[-1], side='right'), len(cumulative) - 1)
+        y, x = np.unravel_index(flat_index, residual.shape)
+        positions[i] = (x, y)
+        exclude(residual, int(x), int(y))
+        count('sampler_residual_map_draws')
+    return len(positions)
+
+
+class _OccupancyGrid:
+    '''
+    Grid of cells with a side length of at least min_distance that stores the
+    accepted P-bodies. A candidate only needs to be compared to the P-bodies in
+    its own and the 8 neighboring cells, instead of all accepted P-bodies.
+    '''
 
+    def __init__(self, min_distance):
+        self.cell_size = max(min_distance, 1)
+        self.min_distance_squared = max(min_distance, 0) ** 2
+        self.cells = {}
 
-def _calculate_marginal_probability(sampling_map):
-    column_sums = sampling_map.sum(axis=0)
+    def _cell(self, x, y):
+        return (int(x // self.cell_size), int(y // self.cell_size))
 
-    marginal_x = rv_discrete(name='marginal_x', values=(
-        np.arange(len(column_sums)),
-        column_sums / column_sums.sum())
-    )
+    def is_free(self, x, y):
+        '''
+        Returns True if no accepted P-body is within min_distance of (x, y)
+        '''
+        cell_x, cell_y = self._cell(x, y)
+        for neighbor_x in range(cell_x - 1, cell_x + 2):
+            for neighbor_y in range(cell_y - 1, cell_y + 2):
+                for other_x, other_y in self.cells.get((neighbor_x, neighbor_y), ()):
+                    if (other_x - x) ** 2 + (other_y - y) ** 2 <= self.min_distance_squared:
+                        return False
+        return True
 
-    return marginal_x
+    def add(self, x, y):
+        self.cells.setdefault(self._cell(x, y), []).append((x, y))
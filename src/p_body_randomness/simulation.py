@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Monte Carlo simulations of randomly distributed P-bodies
+"""
+import numpy as np
+from scipy.stats import beta
+
+from p_body_randomness.sampling import SamplingTable, sample_positions
+from p_body_randomness.metrics import mean_nearest_neighbor_distances
+from p_body_randomness.profiling import timer
+
+
+def simulate_null_distribution(sampling_map, n, rounds, min_distance = 6, seed = None):
+    '''
+    Runs all simulation rounds of a cell in one go.
+
+    Args:
+        sampling_map: A sampling map or a SamplingTable (see sample_pbodies)
+        n: The number of pbodies to sample per round
+        rounds: The number of simulation rounds
+        min_distance: Minimal distance between sampled P-bodies (see sample_pbodies)
+        seed: Seed for numpy.random.default_rng, an int, a SeedSequence or a
+            Generator (whose stream is continued). None uses fresh entropy.
+
+    Returns a tuple of an integer numpy array of shape (rounds, n, 2) with the
+    (x, y) coordinates of all sampled P-bodies and a numpy array with the mean
+    nearest neighbor distance of every round. As the rounds are independent,
+    any prefix of them (e.g. the first 10 or 100) is a valid smaller simulation.
+    '''
+    if isinstance(sampling_map, SamplingTable):
+        sampling_table = sampling_map
+    else:
+        sampling_table = SamplingTable(sampling_map)
+    rng = np.random.default_rng(seed)
+
+    coordinates = np.zeros((rounds, n, 2), dtype=np.int64)
+    with timer('sample_positions'):
+        for i in range(rounds):
+            coordinates[i] = sample_positions(sampling_table, n, min_distance, rng)
+
+    return coordinates, mean_nearest_neighbor_distances(coordinates)
+
+
+def p_value_interval(nb_exceeding, rounds, confidence = 0.99):
+    '''
+    Clopper-Pearson confidence interval of a Monte Carlo p-value.
+
+    Args:
+        nb_exceeding: Number of simulation rounds that exceeded the observed value
+        rounds: Number of simulation rounds
+        confidence: Confidence level of the interval
+
+    Returns a tuple (lower, upper)
+    '''
+    alpha = 1 - confidence
+    lower = beta.ppf(alpha / 2, nb_exceeding, rounds - nb_exceeding + 1) if nb_exceeding > 0 else 0.0
+    upper = beta.ppf(1 - alpha / 2, nb_exceeding + 1, rounds - nb_exceeding) if nb_exceeding < rounds else 1.0
+    return lower, upper
+
+
+def simulate_until_significant(sampling_map, n, observed_mean, min_distance = 6, rng = None,
+                               thresholds = (0.05, 0.95), confidence = 0.99, batch_rounds = 100, max_rounds = 10000):
+    '''
+    Runs simulation rounds in batches until the p-value of the observed mean
+    nearest neighbor distance is clearly on one side of every threshold.
+
+    The p-value is the fraction of rounds with a larger mean nearest neighbor
+    distance than observed_mean (as p_value_measured_lower of the analyses).
+    After every batch, its confidence interval is compared with thresholds.
+    The simulation stops as soon as no threshold lies inside the interval,
+    and only cells whose p-value is close to a threshold run up to
+    max_rounds. The rounds are drawn from rng in the same order as by
+    simulate_null_distribution, so the first rounds are the same as in a
+    simulation with a fixed number of rounds.
+
+    Args:
+        sampling_map: A sampling map or a SamplingTable (see sample_pbodies)
+        n: The number of pbodies to sample per round
+        observed_mean: The observed mean nearest neighbor distance
+        min_distance: Minimal distance between sampled P-bodies (see sample_pbodies)
+        rng: A numpy.random.Generator or a seed for numpy.random.default_rng
+        thresholds: Significance thresholds of the p-value
+        confidence: Confidence level of the interval of the p-value. It is
+            checked after every batch, so it should be higher than the level
+            the p-values are interpreted at.
+        batch_rounds: Number of rounds between two checks
+        max_rounds: Maximal number of rounds
+
+    Returns a numpy array with the mean nearest neighbor distance of every
+    round that was run
+    '''
+    if isinstance(sampling_map, SamplingTable):
+        sampling_table = sampling_map
+    else:
+        sampling_table = SamplingTable(sampling_map)
+    rng = np.random.default_rng(rng)
+
+    simulated_means = np.zeros(0)
+    while len(simulated_means) < max_rounds:
+        rounds = min(batch_rounds, max_rounds - len(simulated_means))
+        _, batch_means = simulate_null_distribution(sampling_table, n, rounds, min_distance, rng)
+        simulated_means = np.concatenate([simulated_means, batch_means])
+
+        lower, upper = p_value_interval(np.count_nonzero(observed_mean < simulated_means), len(simulated_means), confidence)
+        if all(upper < threshold or lower > threshold for threshold in thresholds):
+            break
+
+    return simulated_means
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Summary statistics of P-body patterns and global envelope tests.
+
+pattern_statistics computes the mean nearest neighbor distance, the
+G-function (distribution of the nearest neighbor distances), Ripley's K and
+L functions and the pair correlation function of many patterns at once, all
+from one distance matrix per pattern. Applied to the observed P-bodies and to
+all rounds of simulate_null_distribution, global_envelope_test compares the
+observed curve with the simulated ones over all radii at once, so one set of
+simulations answers every statistic.
+
+The functions are estimated without edge correction. The simulated patterns
+lie in the same sampling area as the observed one and share its edge effects,
+so the tests stay valid, but the values of K, L and the pair correlation
+function at large radii are lower than for an unbounded pattern.
+"""
+import numpy as np
+from scipy.stats import rankdata
+
+from p_body_randomness.profiling import timer
+
+STATISTICS = ['mean_nn', 'G', 'K', 'L', 'pcf']
+
+
+@timer('pattern_statistics')
+def pattern_statistics(coordinates, radii, area, chunk_size = None):
+    '''
+    Computes the summary statistics of many P-body patterns.
+
+    Args:
+        coordinates: numpy array of shape (rounds, n, 2) with the (x, y)
+            coordinates of n P-bodies per pattern (e.g. the observed P-bodies
+            as coordinates[np.newaxis]). Coincident P-bodies are not counted
+            as neighbors or pairs (see nearest_neighbor_distance).
+        radii: Increasing radii (in pixels) to evaluate the functions at
+        area: Area of the sampling area in pixels
+        chunk_size: Number of patterns whose distance matrices are computed
+            together, by default chosen to keep them at a few million entries
+
+    Returns a dict with the arrays
+        mean_nn: (rounds,) mean nearest neighbor distance
+        G: (rounds, len(radii)) fraction of P-bodies whose nearest neighbor is
+            within the radius
+        K: (rounds, len(radii)) Ripley's K, area / (n (n - 1)) times the
+            number of ordered pairs within the radius
+        L: (rounds, len(radii)) sqrt(K / pi), the radius itself for a
+            uniform pattern
+        pcf: (rounds, len(radii)) pair correlation function, the density of
+            pairs at distances between the previous radius (0 for the first)
+            and the radius relative to a uniform pattern
+    '''
+    coordinates = np.asarray(coordinates, dtype=np.float64)
+    radii = np.asarray(radii, dtype=np.float64)
+    rounds, n = coordinates.shape[:2]
+    nb_radii = len(radii)
+    if chunk_size is None:
+        chunk_size = max(1, 4000000 // max(n * n, 1))
+
+    mean_nn = np.zeros(rounds)
+    nn_counts = np.zeros((rounds, nb_radii + 1), dtype=np.int64)
+    pair_counts = np.zeros((rounds, nb_radii + 1), dtype=np.int64)
+    for start in range(0, rounds, chunk_size):
+        chunk = coordinates[start:start + chunk_size]
+        nb_patterns = len(chunk)
+        differences = chunk[:, :, np.newaxis, :] - chunk[:, np.newaxis, :, :]
+        distances = np.sqrt(np.sum(differences ** 2, axis=-1))
+        # The diagonal and coincident p-bodies are not neighbors
+        distances[distances == 0] = np.inf
+        nearest = distances.min(axis=2)
+        mean_nn[start:start + chunk_size] = nearest.mean(axis=1)
+
+        # Histograms over the bins (radii[k-1], radii[k]] of every pattern,
+        # the last bin holds everything beyond the largest radius
+        offsets = (np.arange(nb_patterns) * (nb_radii + 1))[:, np.newaxis]
+        nn_bins = np.searchsorted(radii, nearest, side='left') + offsets
+        nn_counts[start:start + chunk_size] = np.bincount(nn_bins.ravel(), minlength=nb_patterns * (nb_radii + 1)).reshape(nb_patterns, -1)
+        pair_bins = np.searchsorted(radii, distances.reshape(nb_patterns, -1), side='left') + offsets
+        pair_counts[start:start + chunk_size] = np.bincount(pair_bins.ravel(), minlength=nb_patterns * (nb_radii + 1)).reshape(nb_patterns, -1)
+
+    nn_counts, pair_counts = nn_counts[:, :-1], pair_counts[:, :-1]
+    intensity_factor = area / (n * (n - 1))
+    K = intensity_factor * np.cumsum(pair_counts, axis=1)
+    annulus_areas = np.pi * np.diff(radii ** 2, prepend=0.0)
+    return {
+        'mean_nn': mean_nn,
+        'G': np.cumsum(nn_counts, axis=1) / n,
+        'K': K,
+        'L': np.sqrt(K / np.pi),
+        'pcf': intensity_factor * pair_counts / annulus_areas,
+    }
+
+
+def global_envelope_test(observed, simulated, alpha = 0.05, alternative = 'two-sided'):
+    '''
+    Global envelope test of an observed curve against simulated curves, with
+    the extreme rank length (ERL) ordering of Myllymaki et al. (2017).
+
+    Every curve gets the pointwise ranks of its values among all curves, and
+    curves are ordered by their sorted ranks, lexically, from the most extreme
+    one. The p-value is the fraction of the curves (including the observed
+    one) that are at least as extreme as the observed curve. The envelope is
+    the pointwise range of the curves that are less extreme than the alpha
+    most extreme ones, the observed curve leaves it somewhere exactly when
+    the p-value is at most alpha (up to ties).
+
+    Args:
+        observed: Observed curve, a numpy array of shape (m,), or a number
+        simulated: Simulated curves, a numpy array of shape (rounds, m), or
+            (rounds,) for numbers
+        alpha: Level of the envelope
+        alternative: 'two-sided', 'less' (the observed curve is extreme if
+            it is low) or 'greater' (if it is high)
+
+    Returns a tuple (p-value, lower envelope, upper envelope), the envelopes
+    are numpy arrays of shape (m,) (or numbers)
+    '''
+    scalar = np.ndim(observed) == 0
+    curves = np.vstack([np.reshape(observed, (1, -1)), np.reshape(simulated, (len(simulated), -1))])
+    nb_curves = len(curves)
+
+    # Pointwise ranks, the number of curves at least as extreme at a radius
+    if alternative == 'less':
+        ranks = rankdata(curves, method='max', axis=0)
+    elif alternative == 'greater':
+        ranks = rankdata(-curves, method='max', axis=0)
+    elif alternative == 'two-sided':
+        ranks = np.minimum(rankdata(curves, method='max', axis=0), rankdata(-curves, method='max', axis=0))
+    else:
+        raise ValueError('Unknown alternative ' + repr(alternative) + ', use two-sided, less or greater')
+
+    # Lexical order of the sorted ranks, the most extreme curve first. Curves
+    # with equal sorted ranks are equally extreme.
+    sorted_ranks = np.sort(ranks, axis=1)
+    order = np.lexsort(sorted_ranks.T[::-1])
+    ordered = sorted_ranks[order]
+    new_group = np.concatenate([[True], np.any(ordered[1:] != ordered[:-1], axis=1)])
+    group_ends = np.append(np.flatnonzero(new_group)[1:], nb_curves)
+    # Number of curves at least as extreme as every curve
+    at_least_as_extreme = np.empty(nb_curves, dtype=np.int64)
+    at_least_as_extreme[order] = group_ends[np.cumsum(new_group) - 1]
+    extremeness = at_least_as_extreme / nb_curves
+
+    p_value = extremeness[0]
+    inside = curves[extremeness > alpha]
+    if len(inside) == 0:
+        inside = curves
+    lower, upper = inside.min(axis=0), inside.max(axis=0)
+    if scalar:
+        return p_value, lower[0], upper[0]
+    return p_value, lower, upper
+
+
+def envelope_tests(observed_coordinates, simulated_coordinates, radii, area, alpha = 0.05):
+    '''
+    Compares observed P-bodies with simulated patterns for all STATISTICS.
+
+    Args:
+        observed_coordinates: numpy array of shape (n, 2) with the (x, y)
+            coordinates of the observed P-bodies
+        simulated_coordinates: numpy array of shape (rounds, n, 2), e.g.
+            from simulate_null_distribution
+        radii, area: See pattern_statistics
+        alpha: Level of the envelopes
+
+    Returns a dict statistic: (observed, p-value, lower envelope, upper
+    envelope), all tests are two-sided
+    '''
+    observed = pattern_statistics(np.asarray(observed_coordinates)[np.newaxis, :, :2], radii, area)
+    simulated = pattern_statistics(simulated_coordinates, radii, area)
+    tests = {}
+    for statistic in STATISTICS:
+        p_value, lower, upper = global_envelope_test(observed[statistic][0], simulated[statistic], alpha)
+        tests[statistic] = (observed[statistic][0], p_value, lower, upper)
+    return tests
@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Shared fixtures of the tests, the bundled cells of data/input_data.
+"""
+import os
+
+import cv2
+import pytest
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'input_data')
+FILENAME_TEMPLATE = '20180606-SLP_Multiplexing_p1_{well}_x00{x}_y00{y}_z000_t000_{image_type}_Label{label}.png'
+IMAGE_TYPES = {'pbodies': '13_Pbody_Segm', 'protein': '13_Succs', 'dapi': '2_DAPI', 'cellmask': 'segmentation'}
+
+
+def load_images(well, x, y, label):
+    '''
+    Returns the images of a bundled cell as a dict image type: image
+    '''
+    return {image_type: cv2.imread(os.path.join(DATA_PATH, FILENAME_TEMPLATE.format(well = well, x = x, y = y, image_type = image_name, label = label)), 0)
+            for image_type, image_name in IMAGE_TYPES.items()}
+
+
+@pytest.fixture(scope='module')
+def images():
+    '''
+    Returns the images of the bundled cell C03, site x=2, y=0, label 17
+    '''
+    return load_images('C03', 2, 0, 17)
+
+
+@pytest.fixture
+def data_config():
+    '''
+    Returns the data section of a configuration that reads the bundled cells
+    '''
+    return {
+        'base_path': DATA_PATH,
+        'filename_template': FILENAME_TEMPLATE,
+        'wells': ['C03'],
+        'subfolders': {'pbodies': '.', 'protein': '.', 'cellmask': '.', 'dapi': '.'},
+    }
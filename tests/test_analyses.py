@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from p_body_randomness.analyses import ANALYSES, result_columns
+from p_body_randomness.protein_signal_calculation import calculate_mean_intensities
+
+
+@pytest.mark.parametrize('name', ['nn_uniform_sampling', 'nn_volume_sampling', 'nn_area_sampling'])
+@pytest.mark.parametrize('adaptive_simulation', [False, True])
+def test_simulation_rounds_column(images, name, adaptive_simulation):
+    parameters = dict(ANALYSES[name].parameters, adaptive_simulation = adaptive_simulation)
+    columns = result_columns(name, parameters)
+    assert ('Number_of_simulation_rounds' in columns) == adaptive_simulation
+    assert columns[:len(ANALYSES[name].columns)] == ANALYSES[name].columns
+
+    [row] = ANALYSES[name].function(images, parameters, np.random.SeedSequence(0))
+    assert len(row) == len(columns)
+    if adaptive_simulation:
+        assert 100 <= row[-1] <= parameters['max_simulation_rounds']
+
+
+def test_clark_evans_simulation_rounds_column(images):
+    parameters = dict(ANALYSES['nn_uniform_sampling'].parameters, null_model = 'clark_evans')
+    columns = result_columns('nn_uniform_sampling', parameters)
+    [row] = ANALYSES['nn_uniform_sampling'].function(images, parameters, np.random.SeedSequence(0))
+    assert columns[-1] == 'Number_of_simulation_rounds'
+    assert len(row) == len(columns)
+
+
+def test_clark_evans_margin(images):
+    # With a margin of 0 no cell is simulated, with a margin of 1 every cell
+    # is simulated like with the simulation null model
+    parameters = dict(ANALYSES['nn_uniform_sampling'].parameters, null_model = 'clark_evans')
+    [analytic] = ANALYSES['nn_uniform_sampling'].function(images, dict(parameters, clark_evans_margin = 0), np.random.SeedSequence(0))
+    assert analytic[-1] == 0
+    assert analytic[4:8] == [analytic[4]] * 4
+    assert 0 <= analytic[8] <= 1
+
+    [simulated] = ANALYSES['nn_uniform_sampling'].function(images, dict(parameters, clark_evans_margin = 1), np.random.SeedSequence(0))
+    [expected] = ANALYSES['nn_uniform_sampling'].function(images, ANALYSES['nn_uniform_sampling'].parameters, np.random.SeedSequence(0))
+    assert simulated[-1] == 1000
+    assert simulated[:-1] == expected
+    # The analytic expectation is close to the simulated one
+    assert np.isclose(analytic[4], expected[7], rtol = 0.1)
+
+
+def test_result_columns_of_other_analyses():
+    for name in ['protein_intensities', 'spatial_statistics', 'nn_distances', 'nucleus_counts']:
+        assert result_columns(name, ANALYSES[name].parameters) == ANALYSES[name].columns
+
+
+def test_intensities_do_not_depend_on_the_dapi_threshold(images):
+    expected = calculate_mean_intensities(images['protein'], images['pbodies'], images['cellmask'], images['dapi'])
+    for dapi_threshold in [8, 10, 14]:
+        parameters = dict(ANALYSES['protein_intensities'].parameters, dapi_threshold = dapi_threshold, simulation_rounds = 5)
+        [row] = ANALYSES['protein_intensities'].function(images, parameters, np.random.SeedSequence(0))
+        assert np.allclose(row[1:3], expected)
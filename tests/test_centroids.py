@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import glob
+import os
+
+import numpy as np
+import cv2
+import pytest
+
+from p_body_randomness.centroids import extract_pbodies, classify_pbodies
+from p_body_randomness.cell_masks import crop_to_cell
+
+from conftest import DATA_PATH
+
+PBODY_IMAGES = sorted(glob.glob(os.path.join(DATA_PATH, '*_13_Pbody_Segm_Label*.png')))
+
+
+def contour_pbodies(pbodies_image, area_threshold=5):
+    # The measurement of the original analysis, one contour at a time
+    ret, pbodies_binary = cv2.threshold(pbodies_image, 127, 255, 0)
+    contours = cv2.findContours(pbodies_binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[-2]
+    pbodies = []
+    for contour in contours:
+        area = cv2.contourArea(contour)
+        if area > area_threshold:
+            moments = cv2.moments(contour)
+            pbodies.append((int(moments['m10'] / moments['m00']), int(moments['m01'] / moments['m00']), area))
+    return sorted(pbodies)
+
+
+def test_bundled_images():
+    assert len(PBODY_IMAGES) > 100
+
+
+@pytest.mark.parametrize('path', PBODY_IMAGES)
+def test_extract_pbodies_matches_contours(path):
+    image = cv2.imread(path, 0)
+    assert sorted(extract_pbodies(image).tolist()) == contour_pbodies(image)
+
+
+def test_extract_pbodies_is_independent_of_cropping():
+    path = PBODY_IMAGES[0]
+    images = {'pbodies': cv2.imread(path, 0), 'cellmask': cv2.imread(path.replace('13_Pbody_Segm', 'segmentation'), 0)}
+    cropped, (offset_x, offset_y) = crop_to_cell(images)
+    pbodies = extract_pbodies(images['pbodies'])
+    cropped_pbodies = extract_pbodies(cropped['pbodies'])
+    cropped_pbodies['x'] += offset_x
+    cropped_pbodies['y'] += offset_y
+    assert np.array_equal(pbodies, cropped_pbodies)
+
+
+def test_holes_are_not_pbodies():
+    image = np.zeros((50, 50), dtype=np.uint8)
+    cv2.circle(image, (25, 25), 10, 255, -1)
+    cv2.circle(image, (25, 25), 4, 0, -1)
+    cv2.rectangle(image, (2, 2), (3, 3), 255, -1)
+    pbodies = extract_pbodies(image)
+    assert len(pbodies) == 1
+    assert (pbodies[0]['x'], pbodies[0]['y']) == (25, 25)
+
+
+def test_classify_pbodies():
+    image = np.zeros((50, 50), dtype=np.uint8)
+    cv2.circle(image, (10, 10), 4, 255, -1)
+    cv2.circle(image, (40, 40), 4, 255, -1)
+    mask = np.zeros((50, 50), dtype=np.uint8)
+    mask[:25, :25] = 255
+    [inside] = classify_pbodies(extract_pbodies(image), [mask])
+    assert inside.tolist() == [True, False]
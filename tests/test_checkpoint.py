@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import json
+import os
+import time
+
+import numpy as np
+import pytest
+
+from p_body_randomness import pipeline
+from p_body_randomness.checkpoint import CheckpointStore, parameters_hash
+from p_body_randomness.cluster import run_cells
+from p_body_randomness.file_index import load_file_index
+
+
+def test_parameters_hash():
+    assert parameters_hash({'a': 1, 'b': 2}, 4) == parameters_hash({'b': 2, 'a': 1}, 4)
+    assert parameters_hash({'a': 1}, 4) != parameters_hash({'a': 2}, 4)
+    assert parameters_hash({'a': 1}, 4) != parameters_hash({'a': 1}, 5)
+    assert parameters_hash({'a': 1}, 4, {'crop_margin': 20}) != parameters_hash({'a': 1}, 4, {'crop_margin': 5})
+
+
+def test_checkpoint_store_keeps_results(tmp_path):
+    path = str(tmp_path / 'C03.sqlite')
+    cells = [('C03', 0, 0, 10), ('C03', 0, 0, 11), ('C03', 1, 0, 3)]
+    with CheckpointStore(path) as store:
+        store.add(cells[0], [('nn_distances', 'hash', [[1.5], [np.float64(2.0)]])])
+        store.add(cells[2], [('nn_distances', 'hash', []), ('nn_distances', 'other', [[3.0]])])
+
+    with CheckpointStore(path) as store:
+        assert store.completed_cells('C03', 'nn_distances', 'hash') == {('C03', 0, 0, '10'), ('C03', 1, 0, '3')}
+        assert list(store.rows(cells, 'nn_distances', 'hash')) == [(cells[0], [[1.5], [2.0]]), (cells[2], [])]
+        assert list(store.rows(cells, 'nn_distances', 'other')) == [(cells[2], [[3.0]])]
+
+
+def slow_first_cell(well, site_x, site_y, label, seed=None):
+    if label == 1:
+        time.sleep(0.5)
+    return label
+
+
+def test_run_cells_yields_cells_as_they_finish():
+    cells = [('C03', 0, 0, 1), ('C03', 0, 0, 2)]
+    assert [label for _, _, label, _ in run_cells(slow_first_cell, cells, nb_workers=2, seed=4, ordered=False)] == [2, 1]
+    assert [label for _, _, label, _ in run_cells(slow_first_cell, cells, nb_workers=2, seed=4)] == [1, 2]
+
+
+def read_results(output_path):
+    results = {}
+    for name in sorted(os.listdir(output_path)):
+        if name.endswith('.csv'):
+            with open(os.path.join(output_path, name)) as result_file:
+                results[name] = result_file.read()
+    return results
+
+
+def test_run_well_resumes_from_checkpoint(tmp_path, monkeypatch, data_config):
+    config = {'data': data_config, 'output': {'checkpoint': True, 'profile': True}, 'analyses': {'nn_distances': {}, 'nucleus_counts': {}}}
+    config['output']['path'] = str(tmp_path / 'checkpointed')
+    settings = pipeline.get_settings(config)
+    file_index = load_file_index(settings['data'])
+    evaluated_cells = pipeline._evaluated_cells
+
+    def killed_after_10_cells(settings, well, cells, nb_workers, seed):
+        for i, result in enumerate(evaluated_cells(settings, well, cells, nb_workers, seed)):
+            if i == 10:
+                raise KeyboardInterrupt
+            yield result
+
+    monkeypatch.setattr(pipeline, '_evaluated_cells', killed_after_10_cells)
+    with pytest.raises(KeyboardInterrupt):
+        pipeline.run_well(settings, 'C03', file_index, nb_workers=1, seed=4)
+
+    pending = []
+
+    def recorded(settings, well, cells, nb_workers, seed):
+        pending.extend(cells)
+        return evaluated_cells(settings, well, cells, nb_workers, seed)
+
+    monkeypatch.setattr(pipeline, '_evaluated_cells', recorded)
+    pipeline.run_well(settings, 'C03', file_index, nb_workers=1, seed=4)
+    all_cells = pipeline.find_cells(file_index, 'C03', pipeline.required_image_types(settings))
+    assert len(pending) == len(all_cells) - 10
+
+    # The profile summary covers the cells of both runs, the cell that was
+    # profiled but not checkpointed before the kill is only counted once
+    with open(tmp_path / 'checkpointed' / 'ProfileSummary_C03.json') as summary_file:
+        assert json.load(summary_file)['cells'] == len(all_cells)
+
+    # The results of the resumed run are the results of an uninterrupted one
+    monkeypatch.setattr(pipeline, '_evaluated_cells', evaluated_cells)
+    config['output'] = {'path': str(tmp_path / 'uninterrupted')}
+    pipeline.run_well(pipeline.get_settings(config), 'C03', file_index, nb_workers=1, seed=4)
+    results = read_results(tmp_path / 'checkpointed')
+    assert sorted(results) == ['AllNearestNeighborDistances_C03.csv', 'NumberPbodiesInNucleus_C03.csv']
+    assert results == read_results(tmp_path / 'uninterrupted')
+
+
+def test_run_well_recomputes_cells_when_the_cropping_changes(tmp_path, monkeypatch, data_config):
+    config = {'data': data_config, 'output': {'checkpoint': True, 'path': str(tmp_path)}, 'analyses': {'nucleus_counts': {}}}
+    file_index = load_file_index(pipeline.get_settings(config)['data'])
+    evaluated_cells = pipeline._evaluated_cells
+    pending = []
+
+    def recorded(settings, well, cells, nb_workers, seed):
+        pending.append(len(cells))
+        return evaluated_cells(settings, well, cells, nb_workers, seed)
+
+    monkeypatch.setattr(pipeline, '_evaluated_cells', recorded)
+    for crop_margin in [20, 20, 5]:
+        config['data']['crop_margin'] = crop_margin
+        pipeline.run_well(pipeline.get_settings(config), 'C03', file_index, nb_workers=1, seed=4)
+    all_cells = pipeline.find_cells(file_index, 'C03', pipeline.required_image_types(pipeline.get_settings(config)))
+    assert pending == [len(all_cells), 0, len(all_cells)]
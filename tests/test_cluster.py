@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import random
+
+import numpy as np
+
+from p_body_randomness.cluster import run_cells, cell_seed_sequence
+
+CELLS = [('C03', 0, 0, '10'), ('C03', 0, 0, '11'), ('C03', 0, 1, '10'), ('C03', 1, 0, '10'), ('C04', 0, 0, '10'), ('D03', 2, 1, '7')]
+
+
+def random_draws(well, site_x, site_y, label, seed=None):
+    # Draws from the stream of the cell and from the global numpy state
+    return np.random.default_rng(seed).random(4).tolist() + np.random.random_sample(2).tolist()
+
+
+def draws_per_cell(cells, nb_workers, seed):
+    # run_cells yields the cells in order, without their well
+    return {cell: results for cell, (*_, results) in zip(cells, run_cells(random_draws, cells, nb_workers=nb_workers, seed=seed))}
+
+
+def test_cells_get_the_same_stream_alone_and_with_the_plate():
+    shuffled = list(CELLS)
+    random.Random(0).shuffle(shuffled)
+    with_plate = draws_per_cell(shuffled, 3, 7)
+    for cell in CELLS:
+        assert draws_per_cell([cell], 1, 7) == {cell: with_plate[cell]}
+    # Different cells get different draws, another seed other draws
+    assert len({tuple(draws) for draws in with_plate.values()}) == len(CELLS)
+    assert draws_per_cell(CELLS[:1], 1, 8) != {CELLS[0]: with_plate[CELLS[0]]}
+
+
+def test_cells_get_independent_streams():
+    entropy = np.random.SeedSequence(7).entropy
+    states = [tuple(cell_seed_sequence(entropy, cell).generate_state(4)) for cell in CELLS]
+    assert len(set(states)) == len(CELLS)
+    # The well is part of the key, not only the site and label
+    assert cell_seed_sequence(entropy, ('C03', 0, 0, '10')).spawn_key != cell_seed_sequence(entropy, ('C04', 0, 0, '10')).spawn_key
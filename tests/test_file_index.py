@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+
+import pytest
+
+from p_body_randomness import file_index
+from p_body_randomness.file_index import template_regex, build_file_index, load_file_index, find_cells
+
+TEMPLATE = 'plate_{well}_x00{x}_y00{y}_{image_type}_Label{label}.png'
+IMAGE_TYPES = {'pbodies': 'Pbody_Segm', 'cellmask': 'segmentation', 'dapi': 'DAPI'}
+
+
+def test_template_regex():
+    regex = template_regex(TEMPLATE, IMAGE_TYPES.values())
+    match = regex.match('plate_C03_x002_y001_Pbody_Segm_Label17.png')
+    assert match.groupdict() == {'well': 'C03', 'x': '2', 'y': '1', 'image_type': 'Pbody_Segm', 'label': '17'}
+    assert regex.match('plate_C03_x002_y001_Protein_Label17.png') is None
+    assert regex.match('plate_C03_x002_y001_DAPI_Label17.png.bak') is None
+    with pytest.raises(ValueError):
+        template_regex('{plate}_{image_type}.png', IMAGE_TYPES.values())
+
+
+@pytest.fixture
+def data(tmp_path):
+    # The segmentations are in their own folder, the other images share one
+    subfolders = {'pbodies': 'images', 'cellmask': 'segmentations', 'dapi': 'images'}
+    files = [('C03', 0, 0, 3, 'pbodies'), ('C03', 0, 0, 3, 'cellmask'), ('C03', 0, 0, 3, 'dapi'),
+             ('C03', 1, 0, 12, 'pbodies'), ('C03', 1, 0, 12, 'cellmask'), ('C03', 1, 0, 12, 'dapi'),
+             ('C03', 0, 0, 20, 'cellmask'), ('C04', 0, 0, 3, 'cellmask')]
+    for folder in set(subfolders.values()):
+        (tmp_path / folder).mkdir()
+    (tmp_path / 'images' / 'notes.txt').write_text('not an image')
+    for well, x, y, label, image_type in files:
+        filename = TEMPLATE.format(well = well, x = x, y = y, image_type = IMAGE_TYPES[image_type], label = label)
+        (tmp_path / subfolders[image_type] / filename).write_bytes(b'')
+    return {'base_path': str(tmp_path), 'filename_template': TEMPLATE, 'image_types': IMAGE_TYPES, 'subfolders': subfolders}
+
+
+def test_build_file_index(data):
+    index = build_file_index(data)
+    assert len(index) == 8
+    assert index[('C03', 1, 0, '12', 'dapi')] == os.path.join(data['base_path'], 'images', 'plate_C03_x001_y000_DAPI_Label12.png')
+    assert index[('C04', 0, 0, '3', 'cellmask')] == os.path.join(data['base_path'], 'segmentations', 'plate_C04_x000_y000_segmentation_Label3.png')
+
+
+def test_find_cells(data):
+    index = build_file_index(data)
+    assert find_cells(index, 'C03') == [('C03', 0, 0, '3'), ('C03', 0, 0, '20'), ('C03', 1, 0, '12')]
+    # Label 20 has no P-body and DAPI images
+    assert find_cells(index, 'C03', ['cellmask', 'pbodies', 'dapi']) == [('C03', 0, 0, '3'), ('C03', 1, 0, '12')]
+    assert find_cells(index, 'C05') == []
+
+
+@pytest.fixture
+def builds(monkeypatch):
+    # Counts the calls of build_file_index
+    calls = []
+    build = file_index.build_file_index
+
+    def counted(data):
+        calls.append(data)
+        return build(data)
+
+    monkeypatch.setattr(file_index, 'build_file_index', counted)
+    return calls
+
+
+def test_load_file_index_uses_the_cache(data, builds, tmp_path):
+    cache_path = str(tmp_path / 'file_index.json')
+    index = load_file_index(data, cache_path)
+    assert load_file_index(data, cache_path) == index
+    assert len(builds) == 1
+
+
+def test_load_file_index_rebuilds_when_a_folder_changes(data, builds, tmp_path):
+    cache_path = str(tmp_path / 'file_index.json')
+    index = load_file_index(data, cache_path)
+    new_file = tmp_path / 'segmentations' / 'plate_C03_x002_y000_segmentation_Label4.png'
+    new_file.write_bytes(b'')
+    # Make sure the change is visible on filesystems with coarse mtimes
+    mtime = os.stat(tmp_path / 'segmentations').st_mtime + 10
+    os.utime(tmp_path / 'segmentations', (mtime, mtime))
+
+    rebuilt = load_file_index(data, cache_path)
+    assert len(builds) == 2
+    assert set(rebuilt) == set(index) | {('C03', 2, 0, '4', 'cellmask')}
+
+
+def test_load_file_index_rebuilds_when_the_settings_change(data, builds, tmp_path):
+    cache_path = str(tmp_path / 'file_index.json')
+    load_file_index(data, cache_path)
+    data = dict(data, image_types = dict(IMAGE_TYPES, dapi = 'Hoechst'))
+    index = load_file_index(data, cache_path)
+    assert len(builds) == 2
+    assert not any(image_type == 'dapi' for *_, image_type in index)
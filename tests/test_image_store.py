@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from p_body_randomness import pipeline
+from p_body_randomness.cell_masks import crop_to_cell
+from p_body_randomness.file_index import load_file_index, find_cells
+from p_body_randomness.image_store import ImageStore, pack_images
+
+
+@pytest.fixture
+def packed(tmp_path_factory, data_config):
+    # The bundled cells of well C03, packed with a margin of 10 pixels
+    data = pipeline.get_settings({'data': dict(data_config, crop_margin = 10)})['data']
+    file_index = load_file_index(data)
+    image_types = list(data['image_types'])
+    cells = find_cells(file_index, 'C03', image_types)
+    data['image_store'] = str(tmp_path_factory.mktemp('image_store'))
+    pack_images(data['image_store'], cells, file_index, image_types, data['crop_margin'])
+    return data, cells, image_types
+
+
+def test_image_store_matches_the_images(packed):
+    data, cells, image_types = packed
+    store = ImageStore(data['image_store'])
+    unpacked = dict(data, image_store = None)
+    for cell in cells:
+        images, offset = crop_to_cell(pipeline.load_cell_images(unpacked, *cell, image_types), 10)
+        stored, stored_offset = store.load(*cell, image_types, return_offset = True, margin = 10)
+        assert stored_offset == offset
+        for image_type in image_types:
+            np.testing.assert_array_equal(stored[image_type], images[image_type])
+        assert pipeline.load_cell_images(data, *cell, image_types).keys() == images.keys()
+
+
+def test_image_store_rejects_another_margin(packed):
+    data, cells, image_types = packed
+    with pytest.raises(ValueError, match='crop margin of 10, not 20'):
+        ImageStore(data['image_store']).load(*cells[0], image_types, margin = 20)
+    with pytest.raises(ValueError, match='crop margin of 10, not 20'):
+        pipeline.load_cell_images(dict(data, crop_margin = 20), *cells[0], image_types)
+
+
+def test_run_well_from_the_image_store(packed, tmp_path):
+    data, cells, image_types = packed
+    file_index = load_file_index(data)
+    for name, image_store in [('images', None), ('store', data['image_store'])]:
+        config = {'data': dict(data, image_store = image_store), 'analyses': {'nn_distances': {}, 'nucleus_counts': {}}, 'output': {'path': str(tmp_path / name)}}
+        pipeline.run_well(pipeline.get_settings(config), 'C03', file_index, nb_workers = 1, seed = 4)
+    for filename in ['AllNearestNeighborDistances_C03.csv', 'NumberPbodiesInNucleus_C03.csv']:
+        assert (tmp_path / 'images' / filename).read_text() == (tmp_path / 'store' / filename).read_text()
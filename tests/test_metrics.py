@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from p_body_randomness.metrics import nearest_neighbor_distance, clark_evans_mean_nn_distance, mask_perimeter
+from p_body_randomness.simulation import simulate_null_distribution
+
+
+def brute_force_nearest_neighbor_distance(coordinates):
+    distances = np.sqrt(np.sum((coordinates[:, np.newaxis] - coordinates[np.newaxis]) ** 2, axis=-1))
+    distances[distances == 0] = np.inf
+    return distances.min(axis=1)
+
+
+def test_nearest_neighbor_distance_matches_brute_force():
+    coordinates = np.random.default_rng(0).integers(0, 200, size=(50, 2))
+    pbodies = [(x, y, 10.0) for x, y in coordinates.tolist()]
+    assert np.allclose(nearest_neighbor_distance(pbodies), brute_force_nearest_neighbor_distance(coordinates.astype(float)))
+
+
+def test_coincident_pbodies_are_not_neighbors():
+    pbodies = [(10, 10, 8.0), (10, 10, 12.0), (13, 14, 6.0), (40, 10, 7.0)]
+    assert np.allclose(nearest_neighbor_distance(pbodies), [5, 5, 5, np.sqrt(27 ** 2 + 4 ** 2)])
+
+
+def test_coincident_pbodies_can_be_neighbors():
+    pbodies = [(10, 10, 8.0), (10, 10, 12.0), (13, 14, 6.0)]
+    assert np.allclose(nearest_neighbor_distance(pbodies, exclude_coincident=False), [0, 0, 5])
+
+
+def test_only_coincident_pbodies():
+    with pytest.raises(ValueError):
+        nearest_neighbor_distance([(10, 10, 8.0), (10, 10, 12.0)])
+    assert np.allclose(nearest_neighbor_distance([(10, 10, 8.0), (10, 10, 12.0)], exclude_coincident=False), [0, 0])
+
+
+def test_too_few_pbodies():
+    assert len(nearest_neighbor_distance([])) == 0
+    with pytest.raises(ValueError):
+        nearest_neighbor_distance([(10, 10, 8.0)])
+
+
+def test_clark_evans_mean_nn_distance_matches_simulation():
+    # P-bodies placed uniformly in a square, without a minimal distance
+    mask = np.zeros((140, 140), dtype=np.uint8)
+    mask[20:120, 20:120] = 255
+    _, simulated_means = simulate_null_distribution(mask, 30, 2000, min_distance = 0, seed = 0)
+    expected, expected_std = clark_evans_mean_nn_distance(30, np.count_nonzero(mask), mask_perimeter(mask))
+    assert np.isclose(np.mean(simulated_means), expected, rtol = 0.02)
+    assert np.isclose(np.std(simulated_means), expected_std, rtol = 0.05)
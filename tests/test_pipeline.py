@@ -0,0 +1,21 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import pytest
+
+from p_body_randomness import pipeline
+
+
+def test_get_settings_sweep():
+    config = {'analyses': {'nn_area_sampling': {}}, 'sweep': {'min_sampling_distance': [4, 6], 'dapi_threshold': [10]}}
+    assert pipeline.get_settings(config)['sweep'] == [{'min_sampling_distance': 4, 'dapi_threshold': 10},
+                                                      {'min_sampling_distance': 6, 'dapi_threshold': 10}]
+
+
+@pytest.mark.parametrize('sweep, message', [
+    ({'unknown_parameter': [1, 2]}, 'no selected analysis uses: unknown_parameter'),
+    ({'min_sampling_distance': 6}, 'non-empty list, invalid: min_sampling_distance'),
+    ({'min_sampling_distance': []}, 'non-empty list, invalid: min_sampling_distance'),
+])
+def test_get_settings_rejects_invalid_sweeps(sweep, message):
+    with pytest.raises(ValueError, match=message):
+        pipeline.get_settings({'analyses': {'nn_area_sampling': {}}, 'sweep': sweep})
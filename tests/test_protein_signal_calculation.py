@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from p_body_randomness.cell_masks import CellMasks, crop_to_cell
+from p_body_randomness.centroids import generate_centroids_mask
+from p_body_randomness.extract_sample_areas import extract_sample_area
+from p_body_randomness.protein_signal_calculation import ProteinContext
+from p_body_randomness.sampling import sample_pbodies
+
+
+@pytest.fixture(scope='module')
+def cell(images):
+    images, _ = crop_to_cell(images)
+    masks = CellMasks(images['cellmask'], images['dapi'])
+    context = ProteinContext(images['protein'], images['pbodies'], images['cellmask'], images['dapi'], masks = masks)
+    return context, extract_sample_area(images['cellmask'], images['dapi'], masks = masks)
+
+
+@pytest.mark.parametrize('area', [40, 100, 300])
+def test_surround_mean_at_matches_mask(cell, area):
+    # Large P-bodies often touch and are measured from a mask
+    context, sample_area = cell
+    rng = np.random.default_rng(area)
+    for _ in range(200):
+        pbodies = sample_pbodies(sample_area, 12, area_fn=lambda: area, rng=rng)
+        expected = context.surround_mean(generate_centroids_mask(pbodies, sample_area.shape))
+        assert np.isclose(context.surround_mean_at(pbodies), expected, rtol=1e-12, atol=0)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+
+from p_body_randomness import pipeline
+from p_body_randomness.file_index import load_file_index
+from p_body_randomness.results import ResultWriter, ParquetResultWriter, csv_to_dataset, load_results
+
+COLUMNS = ['Well', 'SiteX', 'SiteY', 'Label', 'Number_of_pbodies', 'Area_of_Cytoplasm', 'Mean_nn_distances_measured']
+
+
+def result_rows(well, seed):
+    rng = np.random.default_rng(seed)
+    return [[well, x, 0, label, int(rng.integers(3, 40)), int(rng.integers(10000, 100000)), float(rng.random() * 20)]
+            for x in range(2) for label in range(1, 6)]
+
+
+def test_result_writer_streams_batches(tmp_path):
+    rows = result_rows('C03', 0)
+    with ResultWriter(str(tmp_path / 'results.csv'), COLUMNS, batch_size = 3) as writer:
+        writer.add_rows(rows)
+    pd.testing.assert_frame_equal(pd.read_csv(tmp_path / 'results.csv'), pd.DataFrame(rows, columns = COLUMNS))
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    pytest.importorskip('pyarrow')
+    # Every run and well is written to the dataset and to its own CSV
+    for i, run in enumerate(['run1', 'run2']):
+        for j, well in enumerate(['C03', 'C04']):
+            rows = result_rows(well, 2 * i + j)
+            with ParquetResultWriter(str(tmp_path / 'dataset'), 'nn_area_sampling', run, well, COLUMNS, batch_size = 3) as writer:
+                writer.add_rows(rows)
+            with ResultWriter(str(tmp_path / (run + '_' + well + '.csv')), COLUMNS) as writer:
+                writer.add_rows(rows)
+    return str(tmp_path / 'dataset')
+
+
+def test_load_results_filters_runs_and_wells(tmp_path, dataset):
+    results = load_results(dataset, 'nn_area_sampling', runs = ['run2'], wells = ['C03'])
+    expected = pd.read_csv(tmp_path / 'run2_C03.csv')
+    assert list(results['Run'].unique()) == ['run2']
+    assert results['Number_of_pbodies'].dtype == np.int32
+    assert results['Area_of_Cytoplasm'].dtype == np.int32
+    pd.testing.assert_frame_equal(results[COLUMNS].astype({'Well': str}), expected, check_dtype = False, rtol = 1e-6)
+
+
+def test_load_results_with_columns_and_filters(tmp_path, dataset):
+    results = load_results(dataset, 'nn_area_sampling', columns = ['Run', 'Well', 'Label', 'Number_of_pbodies'],
+                           runs = ['run1'], filters = [('Number_of_pbodies', '>=', 20)])
+    expected = pd.concat([pd.read_csv(tmp_path / ('run1_' + well + '.csv')) for well in ['C03', 'C04']])
+    expected = expected[expected['Number_of_pbodies'] >= 20]
+    assert list(results.columns) == ['Run', 'Well', 'Label', 'Number_of_pbodies']
+    assert sorted(zip(results['Well'].astype(str), results['Label'], results['Number_of_pbodies'])) == \
+        sorted(zip(expected['Well'], expected['Label'], expected['Number_of_pbodies']))
+
+
+def test_csv_to_dataset(tmp_path):
+    pytest.importorskip('pyarrow')
+    rows = result_rows('C03', 1) + result_rows('C04', 2)
+    with ResultWriter(str(tmp_path / 'results.csv'), COLUMNS) as writer:
+        writer.add_rows(rows)
+    csv_to_dataset(str(tmp_path / 'results.csv'), str(tmp_path / 'dataset'), 'nn_area_sampling', 'run0')
+    results = load_results(str(tmp_path / 'dataset'), 'nn_area_sampling', runs = ['run0'])
+    results = results.sort_values(['Well', 'SiteX', 'Label']).reset_index(drop = True)
+    pd.testing.assert_frame_equal(results[COLUMNS].astype({'Well': str}), pd.read_csv(tmp_path / 'results.csv'), check_dtype = False, rtol = 1e-6)
+
+
+def test_run_well_writes_the_csv_to_the_dataset(tmp_path, data_config):
+    pytest.importorskip('pyarrow')
+    config = {'data': data_config, 'analyses': {'nucleus_counts': {}},
+              'output': {'path': str(tmp_path / 'results'), 'dataset': str(tmp_path / 'dataset'), 'run': 'run0'}}
+    settings = pipeline.get_settings(config)
+    pipeline.run_well(settings, 'C03', load_file_index(settings['data']), nb_workers = 1, seed = 4)
+    expected = pd.read_csv(tmp_path / 'results' / 'NumberPbodiesInNucleus_C03.csv')
+    results = load_results(str(tmp_path / 'dataset'), 'nucleus_counts', wells = ['C03'])
+    assert len(results) == len(expected) > 0
+    pd.testing.assert_frame_equal(results[list(expected.columns)].astype({'Well': str}), expected, check_dtype = False)
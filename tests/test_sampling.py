@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+from scipy.spatial.distance import pdist
+
+from p_body_randomness.sampling import SamplingTable, SamplingInfeasibleError, sample_positions
+
+
+def square_mask(size, shape = (100, 100)):
+    mask = np.zeros(shape, dtype=np.uint8)
+    mask[10:10 + size, 20:20 + size] = 255
+    return mask
+
+
+@pytest.mark.parametrize('max_rejections', [None, 0])
+def test_sample_positions_keeps_min_distance(max_rejections):
+    # max_rejections = 0 samples everything after the first rejection from
+    # the residual map
+    mask = square_mask(40)
+    sampling_table = SamplingTable(mask)
+    rng = np.random.default_rng(1)
+    for _ in range(20):
+        positions = sample_positions(sampling_table, 25, min_distance=6, rng=rng, max_rejections=max_rejections)
+        assert positions.shape == (25, 2)
+        assert np.all(mask[positions[:, 1], positions[:, 0]] > 0)
+        assert pdist(positions).min() > 6
+
+
+def test_sample_positions_is_reproducible():
+    sampling_table = SamplingTable(square_mask(40))
+    first = sample_positions(sampling_table, 25, rng=np.random.default_rng(3))
+    second = sample_positions(sampling_table, 25, rng=np.random.default_rng(3))
+    assert np.array_equal(first, second)
+
+
+def test_sample_positions_raises_if_infeasible():
+    # Far fewer than 10 positions more than 6 pixels apart fit into 10 x 10
+    # pixels
+    sampling_table = SamplingTable(square_mask(10))
+    with pytest.raises(SamplingInfeasibleError, match='Could not place'):
+        sample_positions(sampling_table, 10, min_distance=6, rng=np.random.default_rng(0))
+
+
+def test_sample_positions_restarts_jammed_placements():
+    # At most 5 positions more than 6 pixels apart fit on a line of 29 pixels
+    # (every 7th pixel), a random placement of 4 of them often jams after 3
+    mask = np.zeros((5, 40), dtype=np.uint8)
+    mask[2, 5:34] = 255
+    sampling_table = SamplingTable(mask)
+    jammed = 0
+    for seed in range(20):
+        try:
+            sample_positions(sampling_table, 4, min_distance=6, rng=np.random.default_rng(seed), max_rejections=0, max_restarts=0)
+        except SamplingInfeasibleError:
+            jammed += 1
+        positions = sample_positions(sampling_table, 4, min_distance=6, rng=np.random.default_rng(seed), max_rejections=0)
+        assert pdist(positions).min() > 6
+    assert jammed > 0
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+from scipy.stats import binomtest
+
+from p_body_randomness.sampling import SamplingTable
+from p_body_randomness.simulation import simulate_null_distribution, simulate_until_significant, p_value_interval
+
+
+def square_mask(size, shape = (100, 100)):
+    mask = np.zeros(shape, dtype=np.uint8)
+    mask[10:10 + size, 20:20 + size] = 255
+    return mask
+
+
+def test_simulate_null_distribution_seeds():
+    sampling_table = SamplingTable(square_mask(40))
+    coordinates, means = simulate_null_distribution(sampling_table, 10, 20, seed = 3)
+    assert coordinates.shape == (20, 10, 2)
+    assert means.shape == (20,)
+    for seed in [np.random.SeedSequence(3), np.random.default_rng(3)]:
+        same_coordinates, same_means = simulate_null_distribution(sampling_table, 10, 20, seed = seed)
+        assert np.array_equal(same_coordinates, coordinates)
+        assert np.array_equal(same_means, means)
+
+
+@pytest.mark.parametrize('nb_exceeding, rounds', [(0, 100), (3, 100), (50, 100), (100, 100), (17, 2500)])
+@pytest.mark.parametrize('confidence', [0.95, 0.99])
+def test_p_value_interval_is_clopper_pearson(nb_exceeding, rounds, confidence):
+    expected = binomtest(nb_exceeding, rounds).proportion_ci(confidence_level = confidence, method = 'exact')
+    assert np.allclose(p_value_interval(nb_exceeding, rounds, confidence), (expected.low, expected.high))
+
+
+@pytest.fixture(scope='module')
+def reference_means():
+    # The distribution of the mean nearest neighbor distance of 10 P-bodies
+    sampling_table = SamplingTable(square_mask(40))
+    return sampling_table, simulate_null_distribution(sampling_table, 10, 2000, seed = 0)[1]
+
+
+@pytest.mark.parametrize('quantile', [0, 0.5, 1])
+def test_simulate_until_significant_stops_after_the_first_batch(reference_means, quantile):
+    # p-values of 1, 0.5 and 0 are far from the thresholds. At a confidence of
+    # 0.99, an interval of 0 of 100 rounds still reaches above 0.05, the first
+    # batch has 200 rounds.
+    sampling_table, means = reference_means
+    observed_mean = np.quantile(means, quantile) + (quantile - 0.5)
+    simulated_means = simulate_until_significant(sampling_table, 10, observed_mean, rng = 1, batch_rounds = 200, max_rounds = 1000)
+    assert len(simulated_means) == 200
+
+
+def test_simulate_until_significant_runs_borderline_cells_to_max_rounds(reference_means):
+    # A p-value of 0.05 stays inside the interval of every batch
+    sampling_table, means = reference_means
+    simulated_means = simulate_until_significant(sampling_table, 10, np.quantile(means, 0.95), rng = 1, batch_rounds = 200, max_rounds = 1000)
+    assert len(simulated_means) == 1000
+    # The rounds are the ones of a simulation with a fixed number of rounds
+    assert np.array_equal(simulated_means, simulate_null_distribution(sampling_table, 10, 1000, seed = 1)[1])
@@ -0,0 +1,17 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import numpy as np
+
+from p_body_randomness.smooth_image import smooth_protein_image, smooth_protein_images
+
+from conftest import load_images
+
+
+def test_smooth_protein_images_matches_smooth_protein_image():
+    image_types = ['protein', 'pbodies', 'cellmask', 'dapi']
+    cells = [[load_images('C03', 0, 0, label)[image_type] for image_type in image_types] for label in [10, 11, 12, 13]]
+    smooth = smooth_protein_images(*zip(*cells), nucleus_percentage = 0.05)
+    assert smooth.shape == (4,) + cells[0][0].shape
+    assert smooth.dtype == np.float32
+    for image, cell in zip(smooth, cells):
+        np.testing.assert_array_equal(image, smooth_protein_image(*cell, nucleus_percentage = 0.05))
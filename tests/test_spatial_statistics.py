@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from p_body_randomness.metrics import nearest_neighbor_distance
+from p_body_randomness.spatial_statistics import STATISTICS, pattern_statistics, global_envelope_test, envelope_tests
+
+SIZE = 100
+RADII = np.arange(2, 32, 2)
+
+
+def uniform_patterns(rng, rounds, n):
+    return rng.random((rounds, n, 2)) * SIZE
+
+
+def test_pattern_statistics_of_one_pattern():
+    coordinates = uniform_patterns(np.random.default_rng(0), 1, 30)
+    statistics = pattern_statistics(coordinates, RADII, SIZE ** 2)
+    nearest = nearest_neighbor_distance(coordinates[0])
+    distances = np.sqrt(np.sum((coordinates[0, :, np.newaxis] - coordinates[0, np.newaxis]) ** 2, axis=-1))
+    pairs = np.array([np.sum(distances[distances > 0] <= radius) for radius in RADII])
+
+    assert np.isclose(statistics['mean_nn'][0], nearest.mean())
+    assert np.allclose(statistics['G'][0], [np.mean(nearest <= radius) for radius in RADII])
+    assert np.allclose(statistics['K'][0], SIZE ** 2 / (30 * 29) * pairs)
+    assert np.allclose(statistics['L'][0], np.sqrt(statistics['K'][0] / np.pi))
+    assert np.allclose(statistics['pcf'][0], SIZE ** 2 / (30 * 29) * np.diff(pairs, prepend=0) / (np.pi * np.diff(RADII ** 2, prepend=0)))
+
+
+def test_pattern_statistics_in_chunks():
+    coordinates = uniform_patterns(np.random.default_rng(1), 7, 12)
+    statistics = pattern_statistics(coordinates, RADII, SIZE ** 2)
+    chunked = pattern_statistics(coordinates, RADII, SIZE ** 2, chunk_size=3)
+    for statistic in STATISTICS:
+        assert np.allclose(statistics[statistic], chunked[statistic])
+
+
+@pytest.mark.parametrize('alternative', ['two-sided', 'less', 'greater'])
+def test_global_envelope_test_null_rate(alternative):
+    # Curves that are exchangeable with the simulated ones are rejected at
+    # about the level of the test
+    rng = np.random.default_rng(2)
+    nb_tests = 400
+    rejected = 0
+    for _ in range(nb_tests):
+        curves = np.cumsum(rng.normal(size=(100, 15)), axis=1)
+        p_value, lower, upper = global_envelope_test(curves[0], curves[1:], alpha=0.05, alternative=alternative)
+        rejected += p_value <= 0.05
+        if alternative == 'two-sided':
+            assert (p_value <= 0.05) == np.any((curves[0] < lower) | (curves[0] > upper))
+    assert 0.02 <= rejected / nb_tests <= 0.09
+
+
+def test_envelope_tests_null_rate():
+    # Uniform patterns against uniform simulations
+    rng = np.random.default_rng(3)
+    nb_tests = 200
+    rejected = {statistic: 0 for statistic in STATISTICS}
+    for _ in range(nb_tests):
+        patterns = uniform_patterns(rng, 100, 20)
+        tests = envelope_tests(patterns[0], patterns[1:], RADII, SIZE ** 2, alpha=0.05)
+        for statistic in STATISTICS:
+            rejected[statistic] += tests[statistic][1] <= 0.05
+    for statistic in STATISTICS:
+        assert 0.01 <= rejected[statistic] / nb_tests <= 0.1, statistic
+
+
+def test_envelope_tests_reject_clustered_pattern():
+    rng = np.random.default_rng(4)
+    centers = rng.random((4, 2)) * SIZE
+    clustered = np.clip(centers[rng.integers(0, 4, 20)] + rng.normal(scale=3, size=(20, 2)), 0, SIZE)
+    tests = envelope_tests(clustered, uniform_patterns(rng, 199, 20), RADII, SIZE ** 2, alpha=0.05)
+    for statistic in STATISTICS:
+        assert tests[statistic][1] <= 0.05, statistic
+
+
+def test_global_envelope_test_of_numbers():
+    # The observed 10 and the simulated 0 to 10 are at most as large
+    p_value, lower, upper = global_envelope_test(10.0, np.arange(99.0), alpha=0.1, alternative='less')
+    assert np.isclose(p_value, 12 / 100)
+    assert np.ndim(lower) == 0 and np.ndim(upper) == 0
+    with pytest.raises(ValueError):
+        global_envelope_test(10.0, np.arange(99.0), alternative='lower')